@@ -0,0 +1,59 @@
+"""
+Scaling of usaddress tagging across worker processes.
+
+    python -m benchmarks.address_tagging [--addresses 20000] [--chunk-size 64]
+"""
+import argparse
+import os
+import random
+import time
+
+from core.services.quotes.parsing import ParallelAddressTagger, tag_addresses
+
+STREETS = ["Pennsylvania Avenue NW", "Main Street", "Ocean Drive", "Elm Street SE"]
+CITIES = [
+    ("Washington", "DC", "20500"),
+    ("Anchorage", "AK", "99501"),
+    ("Austin", "TX", "73301"),
+]
+
+
+def raw_addresses(count: int, seed: int = 42) -> list[str]:
+    rng = random.Random(seed)
+    return [
+        f"{rng.randint(1, 9999)} {rng.choice(STREETS)}, {city}, {state} {zip_code}"
+        for city, state, zip_code in (rng.choice(CITIES) for _ in range(count))
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--addresses", type=int, default=20000)
+    parser.add_argument("--chunk-size", type=int, default=64)
+    args = parser.parse_args()
+    addresses = raw_addresses(args.addresses)
+
+    start = time.perf_counter()
+    expected = tag_addresses(addresses)
+    serial = time.perf_counter() - start
+    print(f"{'serial':<12} {args.addresses / serial:>10.0f} addresses/s")
+
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        with ParallelAddressTagger(
+            workers=workers, chunk_size=args.chunk_size
+        ) as tagger:
+            tagger(addresses[: workers * args.chunk_size])  # start every worker
+            start = time.perf_counter()
+            results = tagger(addresses)
+            elapsed = time.perf_counter() - start
+        assert results == expected
+        print(
+            f"{workers:>2} workers   {args.addresses / elapsed:>10.0f} addresses/s "
+            f"({serial / elapsed:.2f}x serial)"
+        )
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""
+Time each stage of the quote pipeline on its own and end to end, offline, on
+seeded inputs, against a throwaway test database and zip index.
+
+    python -m benchmarks.pipeline [--stage create_quote ...] [--output results.json]
+    python -m benchmarks.pipeline --compare results.json [--threshold 0.2]
+
+With ``--compare`` the run exits with status 1 when a stage got slower than the
+baseline by more than the threshold.
+"""
+import argparse
+import itertools
+import math
+import os
+import random
+import sys
+import tempfile
+from statistics import median
+from typing import Callable, NamedTuple
+
+from benchmarks.utils import load_results, measure, report, save_results, setup_django
+
+STREETS = [
+    "Pennsylvania Avenue NW",
+    "Elm Street SE",
+    "Ocean Drive NE",
+    "Lake Road SW",
+    "Maple Boulevard NW",
+]
+CITIES = [
+    ("Washington", "DC", "20500"),
+    ("Anchorage", "AK", "99501"),
+    ("Beverly Hills", "CA", "90210"),
+    ("Austin", "TX", "73301"),
+    ("Honolulu", "HI", "96813"),
+    ("Madison", "WI", "53703"),
+]
+# Values the validators reject, so the error path is timed too
+INVALID_ZIP_CODES = ["00000", "2050", "ABCDE"]
+INVALID_STATES = ["ZZ", "dc", ""]
+
+
+class Inputs(NamedTuple):
+    raw_addresses: list[str]
+    zip_codes: list[str]
+    states: list[str]
+    pricing: list[tuple[bool, bool, bool]]
+
+
+class Stage(NamedTuple):
+    name: str
+    func: Callable[[], object]
+    number: int
+    setup: Callable[[], None] | None = None
+
+
+def seeded_inputs(seed: int, count: int) -> Inputs:
+    rng = random.Random(seed)
+    cities = [rng.choice(CITIES) for _ in range(count)]
+    return Inputs(
+        raw_addresses=[
+            f"{rng.randint(1, 9999)} {rng.choice(STREETS)}, {city}, {state} {zip_code}"
+            for city, state, zip_code in cities
+        ],
+        zip_codes=[zip_code for _, _, zip_code in cities] + INVALID_ZIP_CODES,
+        states=[state for _, state, _ in cities] + INVALID_STATES,
+        pricing=[
+            (rng.random() < 0.5, rng.random() < 0.5, rng.random() < 0.5)
+            for _ in range(count)
+        ],
+    )
+
+
+def build_stages(inputs: Inputs, scale: float) -> list[Stage]:
+    from django.core.exceptions import ValidationError
+
+    from core.services.policies.services import checkout
+    from core.services.quotes.services import (
+        additional_discounts,
+        additional_fees,
+        address_cache,
+        address_parser,
+        create_quote,
+    )
+    from core.validators import state_validator, zip_code_validator
+
+    count = len(inputs.raw_addresses)
+    many = max(1, int(10000 * scale))
+    raw_addresses = itertools.cycle(inputs.raw_addresses)
+    zip_codes = itertools.cycle(inputs.zip_codes)
+    states = itertools.cycle(inputs.states)
+    pricing = itertools.cycle(inputs.pricing)
+    quote_inputs = itertools.cycle(zip(inputs.raw_addresses, inputs.pricing))
+
+    def validate(validator, values):
+        def func():
+            try:
+                validator(next(values))
+            except ValidationError:
+                pass
+
+        return func
+
+    def price():
+        had_previously_cancel, never_cancel, new_property = next(pricing)
+        return (
+            additional_fees(had_previously_cancel, "AK"),
+            additional_discounts(never_cancel, new_property),
+        )
+
+    def new_quote():
+        raw_address, (had_previously_cancel, never_cancel, new_property) = next(
+            quote_inputs
+        )
+        return create_quote(
+            had_previously_cancel_volcano_policy=had_previously_cancel,
+            never_cancel_volcano_policy=never_cancel,
+            new_property=new_property,
+            address=raw_address,
+        )
+
+    # checkout needs a fresh quote per call, created untimed before each run
+    pending = []
+
+    def create_pending_quotes():
+        pending[:] = [new_quote().quote_number for _ in range(count)]
+
+    return [
+        Stage(
+            "address_parser (cold)",
+            lambda: address_parser(next(raw_addresses)),
+            count,
+            setup=address_cache.clear,
+        ),
+        Stage(
+            "address_parser (cached)",
+            lambda: address_parser(next(raw_addresses)),
+            count,
+        ),
+        Stage("zip_code_validator", validate(zip_code_validator, zip_codes), many),
+        Stage("state_validator", validate(state_validator, states), many),
+        Stage("additional_fees + additional_discounts", price, many),
+        Stage("create_quote", new_quote, count, setup=address_cache.clear),
+        Stage(
+            "checkout",
+            lambda: checkout(pending.pop()),
+            count,
+            setup=create_pending_quotes,
+        ),
+        Stage(
+            "end to end",
+            lambda: checkout(new_quote().quote_number),
+            count,
+            setup=address_cache.clear,
+        ),
+    ]
+
+
+def write_zip_index(path: str) -> None:
+    from core.zip_index import ZipIndex, ZipRecord
+
+    with open(path, "wb") as fh:
+        fh.write(
+            ZipIndex.pack(
+                {
+                    zip_code: ZipRecord(state, math.nan, math.nan)
+                    for _, state, zip_code in CITIES
+                }
+            )
+        )
+
+
+def run(
+    stage_names: list[str] | None, seed: int, count: int, scale: float, repeat: int
+) -> dict:
+    from django.db import connection
+    from django.test.utils import override_settings
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        zip_index_path = os.path.join(directory, "us_zip_index.bin")
+        write_zip_index(zip_index_path)
+        database_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True
+        )
+        try:
+            with override_settings(ZIP_INDEX_PATH=zip_index_path):
+                for stage in build_stages(seeded_inputs(seed, count), scale):
+                    if stage_names and stage.name not in stage_names:
+                        continue
+                    runs = measure(
+                        stage.func,
+                        number=stage.number,
+                        repeat=repeat,
+                        setup=stage.setup,
+                    )
+                    results[stage.name] = {
+                        "seconds_per_call": median(runs),
+                        "best": min(runs),
+                        "runs": runs,
+                        "number": stage.number,
+                    }
+                    report(stage.name, median(runs))
+        finally:
+            connection.creation.destroy_test_db(database_name, verbosity=0)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Description:
+        Print the change of every stage against the baseline and return the
+        stages slower by more than ``threshold`` (0.2 is 20%).
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        change = result["seconds_per_call"] / baseline[name]["seconds_per_call"] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<40} {change:>+11.1%}{flag}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--stage", action="append", dest="stages", help="Only run this stage"
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--addresses", type=int, default=200, help="Distinct seeded addresses"
+    )
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="Multiplier of the calls per cheap stage",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    setup_django()
+    results = run(args.stages, args.seed, args.addresses, args.scale, args.repeat)
+    if args.output:
+        save_results(
+            args.output,
+            results,
+            seed=args.seed,
+            addresses=args.addresses,
+            repeat=args.repeat,
+        )
+    if args.compare:
+        print()
+        if compare(results, load_results(args.compare), args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
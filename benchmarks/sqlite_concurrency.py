@@ -0,0 +1,58 @@
+"""
+Write throughput of SQLite as concurrent writers are added, in its default mode,
+with locked writes retried, in the WAL concurrency mode of ``core.sqlite``, and
+with both.
+
+    python -m benchmarks.sqlite_concurrency [--threads 1 4 16] [--duration 5]
+        [--output results.json]
+"""
+import argparse
+import os
+import tempfile
+
+from benchmarks.database import OPERATIONS, run_backend
+from benchmarks.utils import save_results
+
+MODES = {
+    "default": {"SQLITE_CONCURRENCY_MODE": "false", "SQLITE_WRITE_RETRIES": "0"},
+    "retries": {"SQLITE_CONCURRENCY_MODE": "false"},
+    "wal": {"SQLITE_CONCURRENCY_MODE": "true", "SQLITE_WRITE_RETRIES": "0"},
+    "wal + retries": {"SQLITE_CONCURRENCY_MODE": "true"},
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--mode", action="append", dest="modes", choices=list(MODES))
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    print(
+        f"{'mode':<15} {'threads':>7} "
+        + " ".join(f"{operation + '/s':>11} {'errors':>7}" for operation in OPERATIONS)
+        + f" {'p95 ms':>8}"
+    )
+    results = {}
+    for mode in args.modes or MODES:
+        for threads in args.threads:
+            with tempfile.TemporaryDirectory() as directory:
+                url = f"sqlite:///{os.path.join(directory, 'benchmark.sqlite3')}"
+                result = run_backend(url, threads, args.duration, env=MODES[mode])
+            results[f"{mode}, {threads} threads"] = result
+            print(
+                f"{mode:<15} {threads:>7} "
+                + " ".join(
+                    f"{result[operation]['per_second']:>11.1f} "
+                    f"{sum(result[operation]['errors'].values()):>7}"
+                    for operation in OPERATIONS
+                )
+                + f" {result['checkout']['p95'] * 1000:>8.1f}"
+            )
+    if args.output:
+        save_results(args.output, results, duration=args.duration)
+
+
+if __name__ == "__main__":
+    main()
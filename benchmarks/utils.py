@@ -0,0 +1,86 @@
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import time
+from datetime import datetime, timezone
+from statistics import median
+
+
+def setup_django() -> None:
+    import django
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "volcano_quotes.settings")
+    django.setup()
+
+
+def measure(func, *, number: int = 1000, repeat: int = 5, setup=None) -> list[float]:
+    """
+    Description:
+        Seconds per call of ``func`` for each of ``repeat`` runs of ``number``
+        calls. ``setup`` is called untimed before every run.
+    """
+    runs = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        runs.append((time.perf_counter() - start) / number)
+    return runs
+
+
+def timeit(func, *, number: int = 1000, repeat: int = 5, setup=None) -> float:
+    """
+    Description:
+        Median seconds per call of ``func`` over ``repeat`` runs of ``number`` calls.
+    """
+    return median(measure(func, number=number, repeat=repeat, setup=setup))
+
+
+def environment() -> dict:
+    """
+    Description:
+        What a result depends on besides the code, stored next to it so runs from
+        different machines are not compared by mistake.
+    """
+    import django
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "sqlite": sqlite3.sqlite_version,
+    }
+
+
+def save_results(path: str, results: dict, **meta) -> None:
+    with open(path, "w") as fh:
+        json.dump(
+            {"environment": environment(), **meta, "results": results}, fh, indent=2
+        )
+        fh.write("\n")
+
+
+def load_results(path: str) -> dict:
+    with open(path) as fh:
+        return json.load(fh)["results"]
+
+
+def report(name: str, seconds_per_call: float) -> None:
+    print(f"{name:<40} {seconds_per_call * 1e6:>12.2f} us/call")
@@ -0,0 +1,44 @@
+"""
+Compare the legacy per call pgeocode zip code lookup with the shared zip index.
+
+    python -m benchmarks.zip_index
+"""
+import json
+
+from benchmarks.utils import report, setup_django, timeit
+
+ZIP_CODES = ["20500", "99501", "10001", "00000", "94105", "ABCDE"]
+
+
+def legacy_zip_code_is_valid(zip_code: str) -> bool:
+    import pgeocode
+
+    nomi = pgeocode.Nominatim("us")
+    return (
+        json.loads(nomi.query_postal_code(zip_code).to_json())["country_code"]
+        is not None
+    )
+
+
+def main() -> None:
+    setup_django()
+    from core.zip_index import get_zip_index
+
+    index = get_zip_index()
+    for zip_code in ZIP_CODES:
+        assert legacy_zip_code_is_valid(zip_code) == (zip_code in index), zip_code
+
+    report(
+        "pgeocode per call",
+        timeit(lambda: [legacy_zip_code_is_valid(z) for z in ZIP_CODES], number=5)
+        / len(ZIP_CODES),
+    )
+    report(
+        "shared zip index",
+        timeit(lambda: [z in get_zip_index() for z in ZIP_CODES], number=10000)
+        / len(ZIP_CODES),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import copy
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+from core.cache import LRUCache
+
+# token key -> (revision, (user, token)) of the tokens authenticated recently
+token_cache = LRUCache(
+    max_size=settings.TOKEN_CACHE_MAX_SIZE, ttl=settings.TOKEN_CACHE_TTL
+)
+
+
+def token_revision_key(key: str) -> str:
+    # Hashed, token keys are credentials and must not show up in the cache
+    return "token-revision:" + hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def revoke_cached_tokens(keys: list[str]) -> None:
+    """
+    Description:
+        Drop ``keys`` from ``token_cache`` here, and bump their revision in the
+        shared cache so every other worker drops them on their next use.
+        Revisions never expire, an evicted one is drawn again by the next
+        request, see ``token_revision``.
+    """
+    for key in keys:
+        token_cache.delete(key)
+    cache.set_many(
+        {token_revision_key(key): new_token_revision() for key in keys}, None
+    )
+
+
+def new_token_revision() -> str:
+    return uuid.uuid4().hex
+
+
+def token_revision(key: str) -> tuple[str, bool]:
+    """
+    Description:
+        The revision of ``key`` in the shared cache, and whether it was just
+        drawn. A missing revision was never drawn or was evicted, with a
+        revocation in between, so the entries loaded under it are stale.
+    """
+    revision_key = token_revision_key(key)
+    revision = cache.get(revision_key)
+    if revision is not None:
+        return revision, False
+    revision = new_token_revision()
+    if not cache.add(revision_key, revision, None):
+        # Drawn or bumped by another worker meanwhile
+        revision = cache.get(revision_key, revision)
+    return revision, True
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Description:
+        ``TokenAuthentication`` keeping recent token lookups in ``token_cache``, so
+        an authenticated request does not pay the Token -> User query. Entries are
+        revoked by the signals in ``core.signals`` when the token is deleted or its
+        user saved (deactivated, demoted...), and expire after
+        ``settings.TOKEN_CACHE_TTL`` otherwise. Failed lookups are never cached.
+
+        Each entry remembers the revision of its token in the shared cache when
+        it was loaded, and is loaded again once that changed or went missing, so
+        a revocation on any worker sharing ``CACHE_URL`` applies to the next
+        request everywhere, even if the shared cache evicted it since.
+
+        Every request gets its own copy of the cached user and token, views and
+        permission checks may set attributes on them.
+    """
+
+    def authenticate_credentials(self, key):
+        revision, drawn = token_revision(key)
+        cached = token_cache.get(key)
+        if drawn or cached is None or cached[0] != revision:
+            # The revision is read first, a revocation during the query makes
+            # the next request load the token again
+            credentials = super().authenticate_credentials(key)
+            token_cache.set(key, (revision, credentials))
+        else:
+            credentials = cached[1]
+        user, token = credentials
+        user, token = copy.copy(user), copy.copy(token)
+        token.user = user
+        return user, token
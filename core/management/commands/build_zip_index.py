@@ -0,0 +1,45 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.zip_index import ZipIndex, read_geonames, read_pgeocode
+
+
+class Command(BaseCommand):
+    help = "Compile the US postal code data into the memory mapped zip index file"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--source",
+            help="GeoNames US.txt postal code dump, downloaded through pgeocode when omitted",
+        )
+        parser.add_argument(
+            "--output",
+            default=settings.ZIP_INDEX_PATH,
+            help="Destination of the index file (default: settings.ZIP_INDEX_PATH)",
+        )
+
+    def handle(self, *args, **options):
+        source, output = options["source"], options["output"]
+        try:
+            if source:
+                data = ZipIndex.pack(read_geonames(source))
+            else:
+                data = ZipIndex.pack(read_pgeocode())
+        except (OSError, ValueError, IndexError) as ex:
+            raise CommandError(f"Could not read postal code data: {ex}") from ex
+
+        # Write next to the destination and swap it in, so running workers keep
+        # their mapping of the previous file.
+        directory = os.path.dirname(os.path.abspath(output))
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=directory, delete=False) as fh:
+            fh.write(data)
+        # NamedTemporaryFile is private to its owner, workers running as another
+        # user must be able to map the index
+        os.chmod(fh.name, 0o644)
+        os.replace(fh.name, output)
+
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(data)} bytes to {output}"))
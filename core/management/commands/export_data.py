@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from core.services.exports.services import EXPORT_FORMATS, EXPORTS, export
+
+
+class Command(BaseCommand):
+    help = "Stream every quote or policy as CSV or NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("table", choices=sorted(EXPORTS))
+        parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="csv")
+        parser.add_argument("--output", help="Destination file (default: stdout)")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        lines = export(options["table"], options["format"], options["chunk_size"])
+        if options["output"]:
+            with open(options["output"], "w", newline="", encoding="utf-8") as fh:
+                fh.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending="")
@@ -0,0 +1,239 @@
+import contextlib
+import csv
+import itertools
+import json
+import os
+import time
+from typing import BinaryIO, Iterable, Iterator, NamedTuple
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services.quotes.parsing import ParallelAddressTagger, tag_addresses
+from core.services.quotes.services import create_quotes
+from core.validators import address_error_messages
+from core.views import QuotesViewSet
+
+FORMATS = ("csv", "jsonl")
+
+
+class MalformedRow(NamedTuple):
+    error: str
+
+
+def read_rows(
+    path: str, file_format: str, position: int = 0
+) -> Iterator[tuple[dict | MalformedRow, int]]:
+    """
+    Yield the rows of the file from byte ``position`` on, each with the byte
+    offset right after it. Rows that can not be decoded or parsed are yielded as
+    a ``MalformedRow``, so they are rejected like invalid rows instead of
+    stopping the import.
+    """
+    with open(path, "rb") as fh:
+        if file_format == "csv":
+            yield from read_csv_rows(fh, position)
+            return
+
+        fh.seek(position)
+        for line in fh:
+            position += len(line)
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line.decode("utf-8")), position
+            except ValueError as ex:  # JSONDecodeError and UnicodeDecodeError
+                yield MalformedRow(f"Malformed JSON: {ex}"), position
+
+
+def read_csv_rows(
+    fh: BinaryIO, position: int
+) -> Iterator[tuple[dict | MalformedRow, int]]:
+    offset = 0
+
+    def lines() -> Iterator[str]:
+        nonlocal offset
+        for line in fh:
+            offset += len(line)
+            # Undecodable bytes are kept as surrogates and rejected with their row
+            yield line.decode("utf-8", errors="surrogateescape")
+
+    # csv.reader pulls one line at a time, so offset ends right after each record
+    reader = csv.reader(lines())
+    header = next(reader, None)
+    if header is None:
+        return
+    if position:
+        fh.seek(position)
+        offset = position
+
+    while True:
+        try:
+            record = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as ex:
+            yield MalformedRow(f"Malformed CSV: {ex}"), offset
+            continue
+        if not record:
+            continue
+        try:
+            "".join(record).encode("utf-8")
+        except UnicodeEncodeError as ex:
+            yield MalformedRow(f"Not valid UTF-8: {ex}"), offset
+            continue
+        # Like csv.DictReader, missing trailing fields are None
+        yield dict(itertools.zip_longest(header, record[: len(header)])), offset
+
+
+def validate_rows(
+    rows: Iterable[dict | MalformedRow],
+) -> Iterator[tuple[dict | None, dict | None]]:
+    """
+    Yield the validated quote input of each row, or its errors.
+    """
+    for row in rows:
+        if isinstance(row, MalformedRow):
+            yield None, {"non_field_errors": [row.error]}
+            continue
+        serializer = QuotesViewSet.InputModelSerializer(data=row)
+        if serializer.is_valid():
+            yield serializer.data, None
+        else:
+            yield None, serializer.errors
+
+
+def chunked(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def read_checkpoint(path: str) -> tuple[int, int | None]:
+    """
+    Rows imported and the byte offset to resume from, ``None`` for checkpoints
+    that only hold the row count.
+    """
+    try:
+        with open(path) as fh:
+            values = [int(value) for value in fh.read().split()]
+    except FileNotFoundError:
+        return 0, 0
+    if not values:
+        return 0, 0
+    return values[0], values[1] if len(values) > 1 else None
+
+
+def write_checkpoint(path: str, offset: int, position: int) -> None:
+    with open(f"{path}.tmp", "w") as fh:
+        fh.write(f"{offset} {position}")
+    os.replace(f"{path}.tmp", path)
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream quotes from a CSV or JSONL file (one quote input per row, same fields "
+        "as POST /api/quotes/) into the database in chunks"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("file")
+        parser.add_argument(
+            "--format", choices=FORMATS, help="Defaults to the file extension"
+        )
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=0,
+            help="Processes tagging addresses, 0 tags them in this process",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help=(
+                "File recording the number of rows imported and the byte offset "
+                "after them (default: <file>.checkpoint)"
+            ),
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Skip the rows already imported according to the checkpoint",
+        )
+        parser.add_argument("--errors", help="Write rejected rows to this JSONL file")
+
+    def handle(self, *args, **options):
+        path = options["file"]
+        file_format = options["format"] or os.path.splitext(path)[1].lstrip(".").lower()
+        if file_format not in FORMATS:
+            raise CommandError(f"Unknown format {file_format!r}, use --format")
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist")
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be at least 1")
+
+        checkpoint = options["checkpoint"] or f"{path}.checkpoint"
+        offset, position = read_checkpoint(checkpoint) if options["resume"] else (0, 0)
+        if offset:
+            self.stdout.write(f"Resuming after row {offset}")
+
+        if position is None:
+            # Only the row count is known, the rows before it are read again
+            rows = itertools.islice(read_rows(path, file_format), offset, None)
+        else:
+            rows = read_rows(path, file_format, position)
+        created = rejected = 0
+        started = time.monotonic()
+        with contextlib.ExitStack() as stack:
+            tagger = tag_addresses
+            if options["workers"]:
+                tagger = stack.enter_context(
+                    ParallelAddressTagger(workers=options["workers"])
+                )
+            errors = (
+                stack.enter_context(open(options["errors"], "a", encoding="utf-8"))
+                if options["errors"]
+                else None
+            )
+
+            for read in chunked(rows, options["chunk_size"]):
+                position = read[-1][1]
+                chunk = list(validate_rows(row for row, _ in read))
+                valid = [(index, data) for index, (data, _) in enumerate(chunk) if data]
+                quotes, address_errors = create_quotes(
+                    [data for _, data in valid], tagger=tagger
+                )
+
+                failures = [
+                    (index, row_errors)
+                    for index, (_, row_errors) in enumerate(chunk)
+                    if row_errors
+                ] + [
+                    (index, {"address": address_error_messages(codes)})
+                    for (index, _), quote, codes in zip(valid, quotes, address_errors)
+                    if quote is None
+                ]
+                if errors:
+                    for index, row_errors in sorted(
+                        failures, key=lambda failure: failure[0]
+                    ):
+                        errors.write(
+                            json.dumps({"row": offset + index, "errors": row_errors})
+                            + "\n"
+                        )
+                    errors.flush()
+
+                offset += len(chunk)
+                created += len(chunk) - len(failures)
+                rejected += len(failures)
+                write_checkpoint(checkpoint, offset, position)
+
+                elapsed = time.monotonic() - started
+                rate = (created + rejected) / elapsed if elapsed > 0 else 0
+                self.stdout.write(
+                    f"{offset} rows, {created} created, {rejected} rejected, "
+                    f"{rate:.0f} rows/s"
+                )
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Imported {created} quotes, rejected {rejected} rows")
+        )
@@ -0,0 +1,118 @@
+import os
+import subprocess
+import sys
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Loaded on first use only, importing any of them at startup is a regression
+LAZY_MODULES = ("numpy", "pandas", "pgeocode", "usaddress")
+
+
+class ImportTime(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(output: str) -> list[ImportTime]:
+    """
+    Description:
+        Rows of ``python -X importtime``, ``import time: self | cumulative | name``
+        with the name indented two spaces per nesting level.
+    """
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        if not self_us.strip().isdigit():
+            continue  # header
+        stripped = name.lstrip()
+        rows.append(
+            ImportTime(
+                stripped.strip(),
+                int(self_us),
+                int(cumulative_us),
+                (len(name) - len(stripped) - 1) // 2,
+            )
+        )
+    return rows
+
+
+def measure_imports(modules: list[str]) -> list[ImportTime]:
+    """
+    Description:
+        Import times of ``django.setup()`` followed by ``modules`` in a fresh
+        interpreter, so nothing this process already imported is hidden.
+    """
+    code = "import django; django.setup()\n" + "".join(
+        f"import {module}\n" for module in modules
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        cwd=settings.BASE_DIR,
+        env=os.environ.copy(),
+    )
+    if result.returncode:
+        raise CommandError(result.stderr.strip().splitlines()[-1])
+    return parse_importtime(result.stderr)
+
+
+class Command(BaseCommand):
+    help = (
+        "Report the slowest modules imported by a cold start (django.setup() and the "
+        "URL configuration) and fail when a lazily loaded dependency is imported"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--module",
+            action="append",
+            dest="modules",
+            help="Module to import after django.setup() (default: the ROOT_URLCONF)",
+        )
+        parser.add_argument("--limit", type=int, default=15)
+
+    def handle(self, *args, **options):
+        modules = options["modules"] or [settings.ROOT_URLCONF]
+        rows = measure_imports(modules)
+        total = sum(row.cumulative_us for row in rows if row.depth == 0)
+        self.stdout.write(
+            f"Imported {len(rows)} modules in {total / 1000:.1f} ms "
+            f"(django.setup() and {', '.join(modules)})"
+        )
+
+        self.stdout.write(f"\n{'self ms':>9} {'total ms':>9}  module")
+        for row in sorted(rows, key=lambda row: row.self_us, reverse=True)[
+            : options["limit"]
+        ]:
+            self.stdout.write(
+                f"{row.self_us / 1000:>9.1f} {row.cumulative_us / 1000:>9.1f}  {row.module}"
+            )
+
+        top_level = {}
+        for row in rows:
+            package = row.module.partition(".")[0]
+            top_level[package] = top_level.get(package, 0) + row.self_us
+        self.stdout.write(f"\n{'total ms':>9}  package")
+        for package, self_us in sorted(
+            top_level.items(), key=lambda item: item[1], reverse=True
+        )[: options["limit"]]:
+            self.stdout.write(f"{self_us / 1000:>9.1f}  {package}")
+
+        imported = {row.module for row in rows}
+        eager = [module for module in LAZY_MODULES if module in imported]
+        if eager:
+            raise CommandError(
+                f"{', '.join(eager)} imported at startup, they should load on first use"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"\nNone of {', '.join(LAZY_MODULES)} imported at startup"
+            )
+        )
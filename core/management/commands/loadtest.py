@@ -0,0 +1,364 @@
+import contextlib
+import http.client
+import json
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import (
+    ThreadedWSGIServer,
+    WSGIRequestHandler,
+    get_internal_wsgi_application,
+)
+from django.db import connection
+
+ENDPOINTS = ("register", "quote", "checkout")
+DEFAULT_MIX = "register=1,quote=10,checkout=5"
+PERCENTILES = (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))
+
+
+class Sample(NamedTuple):
+    endpoint: str
+    latency: float
+    error: str | None
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    try:
+        mix = {
+            name.strip(): float(weight)
+            for name, weight in (item.split("=") for item in value.split(","))
+        }
+    except ValueError:
+        raise CommandError(f"--mix must look like {DEFAULT_MIX}")
+    unknown = set(mix) - set(ENDPOINTS)
+    if unknown:
+        raise CommandError(f"Unknown endpoints in --mix: {', '.join(sorted(unknown))}")
+    if any(weight < 0 for weight in mix.values()) or not any(mix.values()):
+        raise CommandError("--mix weights must be positive")
+    return mix
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """
+    Description:
+        Nearest rank percentile of already sorted values.
+    """
+    if not sorted_values:
+        return math.nan
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+class Schedule:
+    """
+    Description:
+        Start time of every request of the run. Closed loop (no ``rate``) starts
+        a client's next request as soon as its previous one returns. Open loop
+        starts requests at a fixed ``rate`` per second whatever the response
+        times, and latencies are measured from the planned start, so the time
+        a request waits for a free client counts as the queueing it is.
+    """
+
+    def __init__(self, duration: float, rate: float | None = None) -> None:
+        self.started = time.perf_counter()
+        self.deadline = self.started + duration
+        self.interval = 1 / rate if rate else None
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def next_start(self) -> float | None:
+        if self.interval is None:
+            now = time.perf_counter()
+            return now if now < self.deadline else None
+        with self._lock:
+            index = self._next
+            self._next += 1
+        start = self.started + index * self.interval
+        return start if start < self.deadline else None
+
+
+class Client:
+    """
+    Description:
+        One simulated user: registers to get a token, then picks its calls from
+        the mix. Checks out the quotes it created, quoting instead when it has
+        none left.
+    """
+
+    def __init__(self, base_url: str, mix: dict[str, float], seed: int) -> None:
+        url = urlsplit(base_url)
+        self.host, self.port = url.hostname, url.port or 80
+        self.prefix = url.path.rstrip("/")
+        self.endpoints = list(mix)
+        self.weights = list(mix.values())
+        self.rng = random.Random(seed)
+        self.token = None
+        self.quote_numbers = deque()
+        self.samples: list[Sample] = []
+        self._connection = None
+
+    def post(self, path: str, data: dict) -> tuple[int, dict]:
+        if self._connection is None:
+            self._connection = http.client.HTTPConnection(
+                self.host, self.port, timeout=30
+            )
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Token {self.token}"
+        try:
+            self._connection.request(
+                "POST", self.prefix + path, body=json.dumps(data), headers=headers
+            )
+            response = self._connection.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException):
+            self._connection.close()
+            self._connection = None
+            raise
+        if response.status >= 400 or not body:
+            return response.status, {}
+        return response.status, json.loads(body)
+
+    def register(self) -> int:
+        username = f"loadtest-{uuid.uuid4().hex[:12]}"
+        status, data = self.post(
+            "/api/users/",
+            {
+                "username": username,
+                "email": f"{username}@example.com",
+                "password": uuid.uuid4().hex,
+            },
+        )
+        if status == 201:
+            self.token = data["token"]
+        return status
+
+    def quote(self) -> int:
+        status, data = self.post(
+            "/api/quotes/",
+            {
+                "had_previously_cancel_volcano_policy": self.rng.random() < 0.5,
+                "never_cancel_volcano_policy": self.rng.random() < 0.5,
+                "new_property": self.rng.random() < 0.5,
+                "address": (
+                    f"{self.rng.randint(1, 9999)} Pennsylvania Avenue NW, "
+                    "Washington, DC 20500"
+                ),
+            },
+        )
+        if status == 201:
+            self.quote_numbers.append(data["quote_number"])
+        return status
+
+    def checkout(self) -> int:
+        status, _ = self.post(
+            "/api/checkout/", {"quote_number": self.quote_numbers.popleft()}
+        )
+        return status
+
+    def pick(self) -> str:
+        if self.token is None:
+            return "register"
+        endpoint = self.rng.choices(self.endpoints, self.weights)[0]
+        if endpoint == "checkout" and not self.quote_numbers:
+            return "quote"
+        return endpoint
+
+    def run(self, schedule: Schedule) -> None:
+        while (start := schedule.next_start()) is not None:
+            delay = start - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            endpoint = self.pick()
+            error = None
+            try:
+                status = getattr(self, endpoint)()
+                if status >= 400:
+                    error = f"HTTP {status}"
+            except (OSError, http.client.HTTPException, ValueError) as ex:
+                error = type(ex).__name__
+            self.samples.append(Sample(endpoint, time.perf_counter() - start, error))
+        if self._connection is not None:
+            self._connection.close()
+
+
+class QuietWSGIRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@contextlib.contextmanager
+def local_server(host: str, port: int):
+    """
+    Description:
+        Serve ``settings.WSGI_APPLICATION`` from a thread, like one
+        ``volcano_quotes.wsgi`` worker.
+    """
+    server = ThreadedWSGIServer((host, port), QuietWSGIRequestHandler)
+    server.set_app(get_internal_wsgi_application())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://{host}:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+@contextlib.contextmanager
+def throwaway_database():
+    """
+    Description:
+        Migrated test database, destroyed afterwards. A file rather than the
+        shared in-memory database on SQLite, which locks whole tables.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        if connection.vendor == "sqlite":
+            connection.settings_dict["TEST"]["NAME"] = os.path.join(
+                directory, "loadtest.sqlite3"
+            )
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def summarize(samples: list[Sample], elapsed: float) -> dict:
+    summary = {}
+    for endpoint in (*ENDPOINTS, "total"):
+        selected = [s for s in samples if endpoint in (s.endpoint, "total")]
+        if not selected:
+            continue
+        latencies = sorted(s.latency for s in selected)
+        errors = Counter(s.error for s in selected if s.error)
+        summary[endpoint] = {
+            "requests": len(selected),
+            "errors": sum(errors.values()),
+            "error_rate": sum(errors.values()) / len(selected),
+            "requests_per_second": len(selected) / elapsed,
+            **{name: percentile(latencies, fraction) for name, fraction in PERCENTILES},
+            "max": latencies[-1],
+            "error_kinds": dict(errors.most_common()),
+        }
+    return summary
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a mix of register, quote and checkout calls from concurrent clients "
+        "against a local WSGI server (or --url) and report latency percentiles, "
+        "error rate and throughput per endpoint"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", help="Load an already running server instead")
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=0, help="0 picks a free port")
+        parser.add_argument(
+            "--live-database",
+            action="store_true",
+            help="Write to the configured database instead of a throwaway test one",
+        )
+        parser.add_argument("--threads", type=int, default=8, help="Concurrent clients")
+        parser.add_argument("--duration", type=float, default=10, help="Seconds")
+        parser.add_argument(
+            "--rate",
+            type=float,
+            help="Requests per second across all clients (open loop). By default "
+            "every client sends its next request when the previous one returns",
+        )
+        parser.add_argument(
+            "--mix", default=DEFAULT_MIX, help="Weight of each endpoint"
+        )
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--output", help="Write the summary to this JSON file")
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options["mix"])
+        if options["threads"] < 1:
+            raise CommandError("--threads must be at least 1")
+        if options["rate"] is not None and options["rate"] <= 0:
+            raise CommandError("--rate must be positive")
+
+        with contextlib.ExitStack() as stack:
+            base_url = options["url"]
+            if not base_url:
+                if not options["live_database"]:
+                    stack.enter_context(throwaway_database())
+                base_url = stack.enter_context(
+                    local_server(options["host"], options["port"])
+                )
+            self.stdout.write(
+                f"Loading {base_url} with {options['threads']} clients for "
+                f"{options['duration']:g}s, "
+                + (f"{options['rate']:g} req/s" if options["rate"] else "closed loop")
+            )
+
+            clients = [
+                Client(base_url, mix, seed=options["seed"] + index)
+                for index in range(options["threads"])
+            ]
+            schedule = Schedule(options["duration"], options["rate"])
+            threads = [
+                threading.Thread(target=client.run, args=(schedule,))
+                for client in clients
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - schedule.started
+
+        samples = [sample for client in clients for sample in client.samples]
+        summary = summarize(samples, elapsed)
+        self.report(summary)
+        if options["rate"] and summary:
+            achieved = summary["total"]["requests_per_second"]
+            if achieved < 0.95 * options["rate"]:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"Sent {achieved:.1f} of {options['rate']:g} req/s, latencies "
+                        "include the wait for a free client, add --threads"
+                    )
+                )
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                json.dump(
+                    {
+                        "url": base_url,
+                        "threads": options["threads"],
+                        "duration": elapsed,
+                        "rate": options["rate"],
+                        "mix": mix,
+                        "endpoints": summary,
+                    },
+                    fh,
+                    indent=2,
+                )
+
+    def report(self, summary: dict) -> None:
+        self.stdout.write(
+            f"{'endpoint':<10} {'requests':>9} {'errors':>8} {'req/s':>8} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+        )
+        for endpoint, stats in summary.items():
+            self.stdout.write(
+                f"{endpoint:<10} {stats['requests']:>9} {stats['error_rate']:>8.1%} "
+                f"{stats['requests_per_second']:>8.1f} "
+                + " ".join(
+                    f"{stats[name] * 1000:>8.1f}"
+                    for name in ("p50", "p95", "p99", "max")
+                )
+            )
+            for error, count in stats["error_kinds"].items():
+                self.stdout.write(self.style.ERROR(f"{'':<10} {count:>9} x {error}"))
@@ -0,0 +1,164 @@
+import gc
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.servers.basehttp import get_internal_wsgi_application
+from django.db import connections
+from gunicorn.app.base import BaseApplication
+
+from core import metrics, warmup
+from core.services.quotes.write_behind import quote_writer
+from volcano_quotes.caches import has_atomic_add, is_shared
+
+BACKLOG = 1024
+# Seconds an idle keep-alive connection is kept open, so stopping workers do
+# not wait on clients that will never send another request
+KEEP_ALIVE_TIMEOUT = 5
+
+
+class Server(BaseApplication):
+    """
+    Description:
+        gunicorn serving the Django WSGI application with ``gthread`` workers,
+        configured from the command line rather than a gunicorn config file. The
+        hooks below warm up the master before it forks (or each worker after it
+        with ``preload_app`` off), and write out the worker's queued quotes and
+        metrics when it exits.
+    """
+
+    def __init__(self, command: BaseCommand, application, options: dict) -> None:
+        self.command = command
+        self.application = application
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for name, value in self.options.items():
+            self.cfg.set(name, value)
+        self.cfg.set("on_starting", self.on_starting)
+        self.cfg.set("when_ready", self.when_ready)
+        self.cfg.set("post_worker_init", self.post_worker_init)
+        self.cfg.set("worker_exit", self.worker_exit)
+        self.cfg.set("on_exit", self.on_exit)
+
+    def load(self):
+        return self.application
+
+    def on_starting(self, server) -> None:
+        if settings.METRICS_DIR:
+            metrics.clear()
+        if not self.cfg.preload_app:
+            return
+        timings = warmup.warm_up()
+        self.command.stdout.write(
+            "Warmed up in {:.2f}s ({})".format(
+                sum(timings.values()),
+                ", ".join(
+                    f"{name} {seconds:.2f}s" for name, seconds in timings.items()
+                ),
+            )
+        )
+
+    def when_ready(self, server) -> None:
+        # Workers open their own connections, a forked one would be shared
+        connections.close_all()
+        # Keep the collector from writing to the preloaded objects, every
+        # object it touches would be copied into each worker
+        gc.freeze()
+        self.command.stdout.write(
+            f"Serving on {','.join(f'{listener}/' for listener in server.LISTENERS)} "
+            f"with {self.cfg.workers} workers of {self.cfg.threads} threads "
+            f"(master pid {os.getpid()})"
+        )
+        self.command.stdout.flush()
+
+    def post_worker_init(self, worker) -> None:
+        if not self.cfg.preload_app:
+            warmup.warm_up_in_background()
+
+    def worker_exit(self, server, worker) -> None:
+        quote_writer.close()
+        if metrics.enabled():
+            metrics.flush()
+
+    def on_exit(self, server) -> None:
+        self.command.stdout.write("Stopped")
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the WSGI application on gunicorn. The master warms up the address "
+        "model, zip index and rating table before forking, so the workers share "
+        "them copy-on-write and are ready for their first request"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bind", default="127.0.0.1:8000", help="host:port")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Worker processes (default: settings.SERVE_WORKERS)",
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=None,
+            help="Requests served at once by each worker (default: settings.SERVE_THREADS)",
+        )
+        parser.add_argument(
+            "--graceful-timeout",
+            type=float,
+            default=None,
+            help="Seconds workers get to finish their requests on shutdown "
+            "(default: settings.SERVE_GRACEFUL_TIMEOUT)",
+        )
+        parser.add_argument(
+            "--no-preload",
+            action="store_false",
+            dest="preload",
+            help="Warm up in each worker after forking instead of once in the master",
+        )
+
+    def handle(self, *args, **options):
+        workers = options["workers"] or settings.SERVE_WORKERS
+        threads = options["threads"] or settings.SERVE_THREADS
+        graceful_timeout = options["graceful_timeout"]
+        if graceful_timeout is None:
+            graceful_timeout = settings.SERVE_GRACEFUL_TIMEOUT
+
+        if workers > 1 and not is_shared(settings.CACHES["default"]):
+            self.stderr.write(
+                self.style.WARNING(
+                    "CACHE_URL is not shared between processes, every worker caches "
+                    "quotes and idempotency keys on its own, see volcano_quotes.caches"
+                )
+            )
+        elif workers > 1 and not has_atomic_add(settings.CACHES["default"]):
+            self.stderr.write(
+                self.style.WARNING(
+                    "CACHE_URL can not claim idempotency keys atomically, two workers "
+                    "may both run a retried POST, use redis://"
+                )
+            )
+
+        gunicorn_options = {
+            "bind": [options["bind"]],
+            "workers": workers,
+            # A pool of threads per worker, so the database connection of every
+            # thread is reused for CONN_MAX_AGE and a worker holds at most
+            # `threads` of them
+            "worker_class": "gthread",
+            "threads": threads,
+            "graceful_timeout": graceful_timeout,
+            "preload_app": options["preload"],
+            "backlog": BACKLOG,
+            "keepalive": KEEP_ALIVE_TIMEOUT,
+            "proc_name": "volcano_quotes",
+        }
+        if os.path.isdir("/dev/shm"):
+            # Worker heartbeats in memory, a slow disk would get workers killed
+            gunicorn_options["worker_tmp_dir"] = "/dev/shm"
+
+        Server(self, get_internal_wsgi_application(), gunicorn_options).run()
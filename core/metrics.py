@@ -0,0 +1,313 @@
+"""
+Stage timings of the quote pipeline, exposed at ``/metrics`` in the Prometheus
+text format. Off unless ``settings.METRICS_ENABLED``, a timed call then costs one
+flag check.
+
+Every process keeps its own counts. With ``settings.METRICS_DIR`` set, each one
+also writes a snapshot file there every ``settings.METRICS_FLUSH_INTERVAL``
+seconds and on exit, and ``/metrics`` merges the snapshots of every worker.
+``manage.py serve`` clears it when it starts, files of old workers would keep
+counting.
+"""
+import atexit
+import bisect
+import contextlib
+import functools
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+STAGE_DURATION = "volcano_stage_duration_seconds"
+STAGE_EXCEPTIONS = "volcano_stage_exceptions_total"
+REQUEST_DURATION = "volcano_request_duration_seconds"
+SQLITE_WRITE_RETRIES = "volcano_sqlite_write_retries_total"
+WRITE_BEHIND_DROPPED = "volcano_write_behind_dropped_quotes_total"
+
+# name -> (type, label, help)
+FAMILIES = {
+    STAGE_DURATION: (
+        "histogram",
+        "stage",
+        "Seconds spent in each stage of the quote and checkout pipeline.",
+    ),
+    STAGE_EXCEPTIONS: (
+        "counter",
+        "stage",
+        "Calls of each stage that raised, validation errors included.",
+    ),
+    REQUEST_DURATION: (
+        "histogram",
+        "view",
+        "Seconds spent serving each view, middleware and serialization included.",
+    ),
+    SQLITE_WRITE_RETRIES: (
+        "counter",
+        "operation",
+        "Write transactions run again after SQLite reported the database locked.",
+    ),
+    WRITE_BEHIND_DROPPED: (
+        "counter",
+        "reason",
+        "Quotes answered to clients that the write-behind queue never wrote.",
+    ),
+}
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Registry:
+    """
+    Description:
+        Histograms and counters of one process, keyed by (family, label value).
+        Histogram counts are per bucket, the last one is ``+Inf``.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._histograms: dict[tuple[str, str], list] = {}
+        self._counters: dict[tuple[str, str], float] = {}
+
+    def observe(self, family: str, label: str, seconds: float) -> None:
+        bucket = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            histogram = self._histograms.get((family, label))
+            if histogram is None:
+                histogram = self._histograms[(family, label)] = [
+                    [0] * (len(BUCKETS) + 1),
+                    0.0,
+                ]
+            histogram[0][bucket] += 1
+            histogram[1] += seconds
+
+    def increment(self, family: str, label: str, amount: float = 1) -> None:
+        with self._lock:
+            self._counters[(family, label)] = (
+                self._counters.get((family, label), 0) + amount
+            )
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "histograms": [
+                    [family, label, list(counts), total]
+                    for (family, label), (counts, total) in self._histograms.items()
+                ],
+                "counters": [
+                    [family, label, value]
+                    for (family, label), value in self._counters.items()
+                ],
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+registry = Registry()
+
+_enabled = settings.METRICS_ENABLED
+_snapshot_name = f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json"
+_last_flush = time.monotonic()
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def timed(stage: str):
+    """
+    Description:
+        Record the duration of every call of the decorated function, and count
+        the calls that raise, under ``stage``.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                registry.increment(STAGE_EXCEPTIONS, stage)
+                raise
+            finally:
+                observe(STAGE_DURATION, stage, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+class stage_timer:
+    """
+    Description:
+        Context manager version of ``timed``, for a stage inside a function.
+    """
+
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str) -> None:
+        self.stage = stage
+        self.start = None
+
+    def __enter__(self) -> None:
+        if _enabled:
+            self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if self.start is None:
+            return
+        if exc_type is not None and issubclass(exc_type, Exception):
+            registry.increment(STAGE_EXCEPTIONS, self.stage)
+        observe(STAGE_DURATION, self.stage, time.perf_counter() - self.start)
+
+
+def observe(family: str, label: str, seconds: float) -> None:
+    registry.observe(family, label, seconds)
+    if (
+        settings.METRICS_DIR
+        and time.monotonic() - _last_flush > settings.METRICS_FLUSH_INTERVAL
+    ):
+        flush()
+
+
+def flush() -> None:
+    """
+    Description:
+        Write the snapshot of this process to ``settings.METRICS_DIR``.
+    """
+    global _last_flush
+    _last_flush = time.monotonic()
+    directory = settings.METRICS_DIR
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as fh:
+        json.dump(registry.snapshot(), fh)
+    os.replace(tmp_path, os.path.join(directory, _snapshot_name))
+
+
+def clear() -> None:
+    """
+    Description:
+        Remove the snapshots of every worker from ``settings.METRICS_DIR``.
+    """
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, "*.json")):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+
+
+def collect() -> dict:
+    """
+    Description:
+        Snapshot of every worker merged, only this process without
+        ``settings.METRICS_DIR``.
+    """
+    if not settings.METRICS_DIR:
+        return registry.snapshot()
+    flush()
+    histograms, counters = {}, {}
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, "*.json")):
+        try:
+            with open(path) as fh:
+                snapshot = json.load(fh)
+        except (OSError, ValueError):
+            continue
+        for family, label, counts, total in snapshot["histograms"]:
+            merged = histograms.setdefault((family, label), [[0] * len(counts), 0.0])
+            merged[0] = [a + b for a, b in zip(merged[0], counts)]
+            merged[1] += total
+        for family, label, value in snapshot["counters"]:
+            counters[(family, label)] = counters.get((family, label), 0) + value
+    return {
+        "histograms": [
+            [*key, counts, total] for key, (counts, total) in histograms.items()
+        ],
+        "counters": [[*key, value] for key, value in counters.items()],
+    }
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render(snapshot: dict) -> str:
+    """
+    Description:
+        Prometheus text exposition of a snapshot.
+    """
+    series = {family: [] for family in FAMILIES}
+    for family, label, counts, total in sorted(snapshot["histograms"]):
+        label_name = FAMILIES[family][1]
+        labels = f'{label_name}="{_escape(label)}"'
+        cumulative = 0
+        for bound, count in zip((*BUCKETS, "+Inf"), counts):
+            cumulative += count
+            series[family].append(
+                f'{family}_bucket{{{labels},le="{bound}"}} {cumulative}'
+            )
+        series[family].append(f"{family}_sum{{{labels}}} {total}")
+        series[family].append(f"{family}_count{{{labels}}} {cumulative}")
+    for family, label, value in sorted(snapshot["counters"]):
+        label_name = FAMILIES[family][1]
+        series[family].append(f'{family}{{{label_name}="{_escape(label)}"}} {value}')
+
+    lines = []
+    for family, (metric_type, _, help_text) in FAMILIES.items():
+        lines.append(f"# HELP {family} {help_text}")
+        lines.append(f"# TYPE {family} {metric_type}")
+        lines.extend(series[family])
+    return "\n".join(lines) + "\n"
+
+
+def _after_fork() -> None:
+    # A forked worker starts from zero under its own snapshot file, with a lock
+    # no thread of the parent can be holding
+    global registry, _snapshot_name
+    registry = Registry()
+    _snapshot_name = f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json"
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+@atexit.register
+def _flush_at_exit() -> None:
+    if _enabled and settings.METRICS_DIR:
+        flush()
+
+
+@receiver(setting_changed)
+def reset_metrics(setting, value, **kwargs):
+    global _enabled
+    if setting == "METRICS_ENABLED":
+        _enabled = value
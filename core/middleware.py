@@ -0,0 +1,337 @@
+import asyncio
+import hashlib
+import logging
+import time
+import uuid
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from django.utils.deprecation import MiddlewareMixin
+from rest_framework import status
+from core import metrics
+from core.queries import QueryCounter, query_budget_for
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "HTTP_IDEMPOTENCY_KEY"
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+IDEMPOTENT_METHODS = ("POST", "PATCH")
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+class StoredResponse(NamedTuple):
+    fingerprint: str
+    status: int
+    headers: tuple[tuple[str, str], ...]
+    content: bytes
+
+
+# Seconds between two checks of a key held by another request
+IDEMPOTENCY_POLL_INTERVAL = 0.05
+
+
+def idempotency_scope(request) -> str:
+    """
+    Description:
+        Who a key belongs to, so two clients picking the same key never see each
+        other's responses. The Authorization header identifies token clients,
+        since DRF only authenticates them later in the view.
+    """
+    authorization = request.META.get("HTTP_AUTHORIZATION")
+    if authorization:
+        return hashlib.sha256(authorization.encode("utf-8")).hexdigest()
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return f"anonymous:{request.META.get('REMOTE_ADDR')}"
+
+
+def idempotency_cache_key(request, key: str) -> str:
+    # Hashed, cache backends limit the length and characters of keys
+    parts = (idempotency_scope(request), request.method, request.path, key)
+    return "idempotency:" + hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def request_fingerprint(request) -> str:
+    return hashlib.sha256(request.body).hexdigest()
+
+
+def is_replayable(response) -> bool:
+    """
+    Description:
+        Successes, and the validation errors the same body always gets again.
+        Server errors, conflicts, missing resources or rejected credentials may
+        not happen on a retry, so the retry runs the request again.
+    """
+    return not response.streaming and (
+        200 <= response.status_code < 300
+        or response.status_code
+        in (status.HTTP_400_BAD_REQUEST, status.HTTP_422_UNPROCESSABLE_ENTITY)
+    )
+
+
+def error_response(detail: str, status_code: int) -> JsonResponse:
+    return JsonResponse({"detail": detail}, status=status_code)
+
+
+class IdempotencyKeyMiddleware(MiddlewareMixin):
+    """
+    Description:
+        Replay the response of the first POST or PATCH carrying a given
+        ``Idempotency-Key`` header to the retries of that request, instead of
+        creating a quote or policy again. Responses are kept in the default
+        cache for ``settings.IDEMPOTENCY_KEY_TTL`` seconds, so with a shared
+        ``CACHE_URL`` a retry landing on another worker is replayed too.
+
+        The request running a key holds a marker added with ``cache.add`` for up
+        to ``settings.IDEMPOTENCY_LOCK_TIMEOUT`` seconds, which only guards the
+        key between workers on a backend with an atomic ``add`` such as Redis. A duplicate arriving
+        meanwhile, on any worker sharing the cache, waits up to
+        ``settings.IDEMPOTENCY_WAIT_TIMEOUT`` seconds for it and then replays its
+        response, or answers 409 if it is still running. Reusing a key with a
+        different body answers 422. Only ``is_replayable`` responses are stored.
+    """
+
+    def __call__(self, request):
+        if (
+            request.method not in IDEMPOTENT_METHODS
+            or IDEMPOTENCY_HEADER not in request.META
+        ):
+            return self.get_response(request)
+
+        key = request.META[IDEMPOTENCY_HEADER]
+        if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return error_response(
+                f"Idempotency-Key must be 1 to {IDEMPOTENCY_KEY_MAX_LENGTH} characters.",
+                status.HTTP_400_BAD_REQUEST,
+            )
+        cache_key = idempotency_cache_key(request, key)
+        fingerprint = request_fingerprint(request)
+
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self._acall(request, cache_key, fingerprint)
+
+        while True:
+            response = self.replay(cache_key, fingerprint)
+            if response is not None:
+                return response
+            holder = self.claim(cache_key)
+            if holder is not None:
+                break
+            if not self.wait(cache_key):
+                return self.still_running()
+
+        try:
+            response = self.replay(cache_key, fingerprint)
+            if response is None:
+                response = self.get_response(request)
+                self.store(cache_key, fingerprint, response)
+            return response
+        finally:
+            self.release(cache_key, holder)
+
+    async def _acall(self, request, cache_key, fingerprint):
+        # Same as __call__ on the async cache API, a cache server round trip
+        # must not block the event loop
+        while True:
+            response = await self.areplay(cache_key, fingerprint)
+            if response is not None:
+                return response
+            holder = await self.aclaim(cache_key)
+            if holder is not None:
+                break
+            if not await self.await_release(cache_key):
+                return self.still_running()
+
+        try:
+            response = await self.areplay(cache_key, fingerprint)
+            if response is None:
+                response = await self.get_response(request)
+                await self.astore(cache_key, fingerprint, response)
+            return response
+        finally:
+            await self.arelease(cache_key, holder)
+
+    @staticmethod
+    def claim(cache_key: str) -> str | None:
+        """
+        Description:
+            Mark the key in flight and return the marker, ``None`` when another
+            request already holds it.
+        """
+        holder = uuid.uuid4().hex
+        if cache.add(f"{cache_key}:lock", holder, settings.IDEMPOTENCY_LOCK_TIMEOUT):
+            return holder
+        return None
+
+    @staticmethod
+    async def aclaim(cache_key: str) -> str | None:
+        holder = uuid.uuid4().hex
+        if await cache.aadd(
+            f"{cache_key}:lock", holder, settings.IDEMPOTENCY_LOCK_TIMEOUT
+        ):
+            return holder
+        return None
+
+    @staticmethod
+    def release(cache_key: str, holder: str) -> None:
+        # Unless the marker expired and another request holds the key now
+        if cache.get(f"{cache_key}:lock") == holder:
+            cache.delete(f"{cache_key}:lock")
+
+    @staticmethod
+    async def arelease(cache_key: str, holder: str) -> None:
+        if await cache.aget(f"{cache_key}:lock") == holder:
+            await cache.adelete(f"{cache_key}:lock")
+
+    @staticmethod
+    def wait(cache_key: str) -> bool:
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+        while cache.get(f"{cache_key}:lock") is not None:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(IDEMPOTENCY_POLL_INTERVAL)
+        return True
+
+    @staticmethod
+    async def await_release(cache_key: str) -> bool:
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+        while await cache.aget(f"{cache_key}:lock") is not None:
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(IDEMPOTENCY_POLL_INTERVAL)
+        return True
+
+    @staticmethod
+    def stored_response(fingerprint: str, response) -> StoredResponse | None:
+        if not is_replayable(response):
+            return None
+        return StoredResponse(
+            fingerprint=fingerprint,
+            status=response.status_code,
+            headers=tuple(response.items()),
+            content=response.content,
+        )
+
+    @classmethod
+    def store(cls, cache_key: str, fingerprint: str, response) -> None:
+        stored = cls.stored_response(fingerprint, response)
+        if stored is not None:
+            cache.set(cache_key, stored, settings.IDEMPOTENCY_KEY_TTL)
+
+    @classmethod
+    async def astore(cls, cache_key: str, fingerprint: str, response) -> None:
+        stored = cls.stored_response(fingerprint, response)
+        if stored is not None:
+            await cache.aset(cache_key, stored, settings.IDEMPOTENCY_KEY_TTL)
+
+    @classmethod
+    def replay(cls, cache_key: str, fingerprint: str) -> HttpResponse | None:
+        return cls.replayed_response(cache.get(cache_key), fingerprint)
+
+    @classmethod
+    async def areplay(cls, cache_key: str, fingerprint: str) -> HttpResponse | None:
+        return cls.replayed_response(await cache.aget(cache_key), fingerprint)
+
+    @staticmethod
+    def replayed_response(
+        stored: StoredResponse | None, fingerprint: str
+    ) -> HttpResponse | None:
+        if stored is None:
+            return None
+        if stored.fingerprint != fingerprint:
+            return error_response(
+                "Idempotency-Key was already used for a different request.",
+                status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        response = HttpResponse(stored.content, status=stored.status)
+        for header, value in stored.headers:
+            response[header] = value
+        response[REPLAYED_HEADER] = "true"
+        return response
+
+    @staticmethod
+    def still_running() -> JsonResponse:
+        return error_response(
+            "A request with this Idempotency-Key is still in progress, retry later.",
+            status.HTTP_409_CONFLICT,
+        )
+
+
+class MetricsMiddleware(MiddlewareMixin):
+    """
+    Description:
+        Time every request by view name into ``core.metrics``, the overhead on
+        top of the pipeline stages is what DRF, serialization and the other
+        middleware cost. Does nothing unless ``settings.METRICS_ENABLED``.
+    """
+
+    def __call__(self, request):
+        if not metrics.enabled():
+            return self.get_response(request)
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self._acall(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self.observe(request, start)
+        return response
+
+    async def _acall(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self.observe(request, start)
+        return response
+
+    @staticmethod
+    def observe(request, start: float) -> None:
+        match = request.resolver_match
+        metrics.observe(
+            metrics.REQUEST_DURATION,
+            match.view_name if match else "unmatched",
+            time.perf_counter() - start,
+        )
+
+
+class QueryBudgetMiddleware(MiddlewareMixin):
+    """
+    Description:
+        Count the queries of every request and their time into the
+        ``X-Query-Count`` and ``X-Query-Time-Ms`` headers, and log a warning when
+        a view goes over its ``query_budget`` or repeats a query shape. Only
+        enabled by ``settings.QUERY_BUDGET_ENABLED``. Async views run their
+        queries on other threads and are not counted.
+    """
+
+    def __call__(self, request):
+        if not settings.QUERY_BUDGET_ENABLED or asyncio.iscoroutinefunction(
+            self.get_response
+        ):
+            return self.get_response(request)
+
+        with QueryCounter() as queries:
+            response = self.get_response(request)
+        response["X-Query-Count"] = str(queries.count)
+        response["X-Query-Time-Ms"] = f"{queries.duration * 1000:.1f}"
+
+        match = request.resolver_match
+        view_name = match.view_name if match else request.path
+        budget = query_budget_for(match, request.method)
+        if budget is not None and queries.count > budget:
+            logger.warning(
+                "%s %s ran %d queries, over its budget of %d",
+                request.method,
+                view_name,
+                queries.count,
+                budget,
+            )
+        for shape, count in queries.repeated():
+            logger.warning(
+                "%s %s ran the same query %d times, possible N+1: %s",
+                request.method,
+                view_name,
+                count,
+                shape,
+            )
+        return response
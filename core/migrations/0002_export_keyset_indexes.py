@@ -0,0 +1,23 @@
+# Generated by Django 4.0.6 on 2026-10-18 12:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="policy",
+            index=models.Index(
+                fields=["created_at", "id"], name="policy_created_at_id"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="quote",
+            index=models.Index(fields=["created_at", "id"], name="quote_created_at_id"),
+        ),
+    ]
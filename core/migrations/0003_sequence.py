@@ -0,0 +1,38 @@
+# Generated by Django 4.0.6 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+def create_quote_number_sequence(apps, schema_editor):
+    Sequence = apps.get_model("core", "Sequence")
+    Sequence.objects.get_or_create(name="quote_number")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0002_export_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Sequence",
+            fields=[
+                (
+                    "name",
+                    models.CharField(
+                        max_length=50,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="Name",
+                    ),
+                ),
+                ("value", models.BigIntegerField(default=0, verbose_name="Value")),
+            ],
+            options={
+                "verbose_name": "Sequence",
+                "verbose_name_plural": "Sequences",
+            },
+        ),
+        migrations.RunPython(create_quote_number_sequence, migrations.RunPython.noop),
+    ]
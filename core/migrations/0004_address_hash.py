@@ -0,0 +1,68 @@
+# Generated by Django 4.0.6 on 2026-10-18 13:05
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def address_hash(address, state, zip_code):
+    normalized = "|".join(
+        " ".join(component.upper().split()) for component in (address, state, zip_code)
+    )
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def merge_duplicate_addresses(apps, schema_editor):
+    """
+    Keep the oldest address of every group of duplicates, point the quotes and
+    policies of the others to it and delete them.
+    """
+    Address = apps.get_model("core", "Address")
+    Quote = apps.get_model("core", "Quote")
+    Policy = apps.get_model("core", "Policy")
+
+    survivors = {}
+    duplicates = {}
+    for address in Address.objects.order_by("created_at", "id").iterator():
+        key = address_hash(address.address, address.state, address.zip_code)
+        if key in survivors:
+            duplicates.setdefault(survivors[key], []).append(address.pk)
+        else:
+            survivors[key] = address.pk
+            Address.objects.filter(pk=address.pk).update(address_hash=key)
+
+    for survivor, merged in duplicates.items():
+        Quote.objects.filter(address_id__in=merged).update(address_id=survivor)
+        Policy.objects.filter(address_id__in=merged).update(address_id=survivor)
+        Address.objects.filter(pk__in=merged).delete()
+
+    if schema_editor.connection.vendor == "postgresql":
+        # The foreign key checks of the updates and deletes above are deferred to
+        # the commit, and PostgreSQL refuses to ALTER a table with pending
+        # trigger events. Run them now, before the unique constraint is added.
+        schema_editor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0003_sequence"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="address",
+            name="address_hash",
+            field=models.CharField(
+                editable=False, max_length=64, null=True, verbose_name="Address Hash"
+            ),
+        ),
+        migrations.RunPython(merge_duplicate_addresses, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="address",
+            name="address_hash",
+            field=models.CharField(
+                editable=False, max_length=64, unique=True, verbose_name="Address Hash"
+            ),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.0.6 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+def detach_duplicate_policies(apps, schema_editor):
+    """
+    Keep the oldest policy of every quote checked out more than once and detach
+    the others from the quote, they stay in the table for review.
+    """
+    Policy = apps.get_model("core", "Policy")
+
+    seen = set()
+    duplicates = []
+    for policy_id, quote_id in (
+        Policy.objects.exclude(quote=None)
+        .order_by("created_at", "id")
+        .values_list("id", "quote_id")
+        .iterator()
+    ):
+        if quote_id in seen:
+            duplicates.append(policy_id)
+        else:
+            seen.add(quote_id)
+
+    Policy.objects.filter(pk__in=duplicates).update(quote=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0004_address_hash"),
+    ]
+
+    operations = [
+        migrations.RunPython(detach_duplicate_policies, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="policy",
+            constraint=models.UniqueConstraint(
+                fields=("quote",), name="policy_unique_quote"
+            ),
+        ),
+    ]
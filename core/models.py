@@ -1,4 +1,5 @@
 from array import array
+import hashlib
 import uuid
 from django.db import models
 from django.shortcuts import reverse
@@ -22,6 +23,17 @@ class BaseModel(models.Model):
         )
 
 
+def address_hash(address: str, state: str, zip_code: str) -> str:
+    """
+    Description:
+        Key of an address, equal for addresses that only differ in case or spacing.
+    """
+    normalized = "|".join(
+        " ".join(component.upper().split()) for component in (address, state, zip_code)
+    )
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
 class Address(BaseModel):
 
     address = models.CharField(_("Address"), max_length=150)
@@ -29,6 +41,9 @@ class Address(BaseModel):
     zip_code = models.CharField(
         _("Zip Code"), max_length=10, validators=[zip_code_validator]
     )
+    address_hash = models.CharField(
+        _("Address Hash"), max_length=64, unique=True, editable=False
+    )
 
     class Meta:
         verbose_name = _("Address")
@@ -37,6 +52,10 @@ class Address(BaseModel):
     def __str__(self):
         return self.address
 
+    def save(self, *args, **kwargs):
+        self.address_hash = address_hash(self.address, self.state, self.zip_code)
+        super().save(*args, **kwargs)
+
     def get_absolute_url(self):
         return reverse("Address_detail", kwargs={"pk": self.pk})
 
@@ -58,6 +77,12 @@ class Policy(BaseModel):
     class Meta:
         verbose_name = _("Policy")
         verbose_name_plural = _("Policies")
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="policy_created_at_id"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["quote"], name="policy_unique_quote"),
+        ]
 
     def __str__(self):
         return self.policy_number
@@ -108,7 +133,26 @@ class Quote(BaseModel):
         indexes = [
             models.Index(fields=["quote_number"], name="quote_number_unique"),
             models.Index(fields=["policy_holder"], name="policy_holder_unique"),
+            models.Index(fields=["created_at", "id"], name="quote_created_at_id"),
         ]
 
     def __str__(self):
         return self.quote_number
+
+
+class Sequence(models.Model):
+    """
+    Description:
+    ● Named counter handing out blocks of numbers, see
+    core.services.quotes.numbers.QuoteNumberAllocator
+    """
+
+    name = models.CharField(_("Name"), max_length=50, primary_key=True)
+    value = models.BigIntegerField(_("Value"), default=0)
+
+    class Meta:
+        verbose_name = _("Sequence")
+        verbose_name_plural = _("Sequences")
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
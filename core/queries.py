@@ -0,0 +1,112 @@
+"""
+Per request SQL accounting: how many queries a view ran, how long they took and
+which query shapes it repeated, the usual sign of an N+1 access pattern. Views
+declare their budget with ``query_budget``, ``QueryBudgetMiddleware`` reports it
+at runtime and the test client in ``core.test.tests`` fails over budget.
+"""
+import contextlib
+import re
+import time
+from collections import Counter
+from typing import NamedTuple
+
+from django.db import connections
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+PLACEHOLDER_LIST = re.compile(r"\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)")
+TRANSACTION_CONTROL = ("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK", "BEGIN", "COMMIT")
+
+
+class ExecutedQuery(NamedTuple):
+    sql: str
+    duration: float
+
+
+def query_shape(sql: str) -> str:
+    """
+    Description:
+        SQL with its literals and placeholder lists collapsed, equal for the
+        queries an N+1 loop runs once per row.
+    """
+    shape = STRING_LITERAL.sub("?", sql)
+    shape = NUMBER_LITERAL.sub("?", shape)
+    shape = shape.replace("%s", "?")
+    shape = PLACEHOLDER_LIST.sub("(?)", shape)
+    return " ".join(shape.split())
+
+
+class QueryCounter:
+    """
+    Description:
+        Record every query run on this thread's connections while in use as a
+        context manager.
+    """
+
+    def __init__(self) -> None:
+        self.queries: list[ExecutedQuery] = []
+        self._stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(ExecutedQuery(sql, time.perf_counter() - start))
+
+    def __enter__(self) -> "QueryCounter":
+        self._stack = contextlib.ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stack.close()
+
+    @property
+    def count(self) -> int:
+        return len(self.queries)
+
+    @property
+    def duration(self) -> float:
+        return sum(query.duration for query in self.queries)
+
+    def repeated(self) -> list[tuple[str, int]]:
+        """
+        Description:
+            Query shapes run more than once, transaction control aside.
+        """
+        shapes = Counter(
+            query_shape(query.sql)
+            for query in self.queries
+            if not query.sql.lstrip().upper().startswith(TRANSACTION_CONTROL)
+        )
+        return [(shape, count) for shape, count in shapes.most_common() if count > 1]
+
+
+def query_budget(max_queries: int):
+    """
+    Description:
+        Declare the most queries a view or viewset action may run per request.
+    """
+
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+
+    return decorator
+
+
+def query_budget_for(resolver_match, method: str) -> int | None:
+    """
+    Description:
+        Budget declared for the view serving a request, ``None`` when it has none.
+    """
+    if resolver_match is None:
+        return None
+    view = resolver_match.func
+    actions = getattr(view, "actions", None)
+    if actions is not None:
+        action = actions.get(method.lower())
+        view = getattr(view.cls, action, None) if action else None
+    return getattr(view, "query_budget", None)
@@ -0,0 +1,146 @@
+import csv
+import io
+import json
+from typing import Callable, Iterable, Iterator
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Model, Q, QuerySet
+from core.models import Quote, Policy
+
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+QUOTE_FIELDS = (
+    "id",
+    "quote_number",
+    "policy_holder",
+    "previously_cancel_policy",
+    "total_term_premium",
+    "total_monthly_premium",
+    "total_monthly_fee",
+    "total_monthly_discount",
+    "address",
+    "state",
+    "zip_code",
+    "created_at",
+    "updated_at",
+)
+
+POLICY_FIELDS = (
+    "id",
+    "policy_number",
+    "quote_number",
+    "is_active",
+    "is_cancel",
+    "total_monthly_premium",
+    "effective_date",
+    "address",
+    "state",
+    "zip_code",
+    "created_at",
+    "updated_at",
+)
+
+
+def keyset_page(queryset: QuerySet, last: Model) -> QuerySet:
+    """
+    Description:
+        The rows of ``queryset`` after ``last`` in (created_at, id) order. The
+        ``created_at >= last`` bound comes first so the database seeks into the
+        (created_at, id) index there, the OR alone would make it scan the index
+        from the start on every page.
+    """
+    return queryset.filter(created_at__gte=last.created_at).filter(
+        Q(created_at__gt=last.created_at)
+        | Q(created_at=last.created_at, id__gt=last.id)
+    )
+
+
+def keyset_iterator(queryset: QuerySet, chunk_size: int = 2000) -> Iterator[Model]:
+    """
+    Description:
+        Walk ``queryset`` in (created_at, id) order one page of ``chunk_size`` rows
+        at a time. Each page starts after the last row of the previous one instead
+        of at an OFFSET, so every page is an index range scan and memory stays flat
+        whatever the size of the table.
+    """
+    queryset = queryset.order_by("created_at", "id")
+    last = None
+    while True:
+        page = queryset if last is None else keyset_page(queryset, last)
+        count = 0
+        for last in page[:chunk_size].iterator(chunk_size=chunk_size):
+            count += 1
+            yield last
+        if count < chunk_size:
+            return
+
+
+def quote_rows(chunk_size: int = 2000) -> Iterator[dict]:
+    for quote in keyset_iterator(Quote.objects.select_related("address"), chunk_size):
+        yield {
+            "id": quote.id,
+            "quote_number": quote.quote_number,
+            "policy_holder": quote.policy_holder,
+            "previously_cancel_policy": quote.previously_cancel_policy,
+            "total_term_premium": quote.total_term_premium,
+            "total_monthly_premium": quote.total_monthly_premium,
+            "total_monthly_fee": quote.total_monthly_fee,
+            "total_monthly_discount": quote.total_monthly_discount,
+            "address": quote.address.address,
+            "state": quote.address.state,
+            "zip_code": quote.address.zip_code,
+            "created_at": quote.created_at,
+            "updated_at": quote.updated_at,
+        }
+
+
+def policy_rows(chunk_size: int = 2000) -> Iterator[dict]:
+    policies = Policy.objects.select_related("address", "quote")
+    for policy in keyset_iterator(policies, chunk_size):
+        yield {
+            "id": policy.id,
+            "policy_number": policy.policy_number,
+            "quote_number": policy.quote.quote_number if policy.quote else None,
+            "is_active": policy.is_active,
+            "is_cancel": policy.is_cancel,
+            "total_monthly_premium": policy.total_monthly_premium,
+            "effective_date": policy.effective_date,
+            "address": policy.address.address,
+            "state": policy.address.state,
+            "zip_code": policy.address.zip_code,
+            "created_at": policy.created_at,
+            "updated_at": policy.updated_at,
+        }
+
+
+EXPORTS: dict[str, tuple[Callable[[int], Iterator[dict]], tuple[str, ...]]] = {
+    "quotes": (quote_rows, QUOTE_FIELDS),
+    "policies": (policy_rows, POLICY_FIELDS),
+}
+
+
+def render_csv(rows: Iterable[dict], fields: tuple[str, ...]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def render_ndjson(rows: Iterable[dict], fields: tuple[str, ...] = ()) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + "\n"
+
+
+def export(name: str, export_format: str, chunk_size: int = 2000) -> Iterator[str]:
+    """
+    Description:
+        Stream the ``quotes`` or ``policies`` table as CSV or NDJSON lines.
+    """
+    rows, fields = EXPORTS[name]
+    render = render_csv if export_format == "csv" else render_ndjson
+    return render(rows(chunk_size), fields)
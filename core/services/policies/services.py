@@ -1,13 +1,64 @@
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
 from django.utils import timezone
+from core import metrics
 from core.models import Quote, Policy
+from core.services.quotes.write_behind import QuoteNotWritten, quote_writer
+from core.sqlite import retry_on_locked
 
 
+@retry_on_locked
+def _checkout(quote_number: str) -> Policy:
+    with transaction.atomic():
+        # Lock the quote so concurrent checkouts of it run one after the other
+        quote = (
+            Quote.objects.select_for_update(of=("self",))
+            .select_related("address")
+            .get(quote_number=quote_number)
+        )
+        policy = Policy.objects.filter(quote=quote).first()
+        if policy is None:
+            policy = Policy.objects.create(
+                policy_number=quote_number,
+                address=quote.address,
+                total_monthly_premium=quote.total_monthly_premium,
+                effective_date=timezone.now(),
+                quote=quote,
+            )
+        else:
+            policy.quote = quote
+            policy.address = quote.address
+        return policy
+
+
+@metrics.timed("checkout")
 def checkout(quote_number: str) -> Policy | None:
-    quote = Quote.objects.get(quote_number=quote_number)
-    return Policy.objects.create(
-        policy_number=quote_number,
-        address=quote.address,
-        total_monthly_premium=quote.total_monthly_premium,
-        effective_date=timezone.now(),
-        quote=quote,
-    )
+    """
+    Description:
+        Turn a quote into a policy in one transaction with a fixed number of
+        queries. Idempotent: checking out a quote again returns its policy
+        instead of creating a duplicate, so double submits and client retries
+        are harmless. A quote still queued by ``quote_writer`` is written first,
+        ``QuoteNotWritten`` when that does not happen in time or when another
+        worker queued it.
+
+        Raises ``Quote.DoesNotExist`` for unknown quotes.
+    """
+    if not quote_writer.wait(quote_number):
+        raise QuoteNotWritten(quote_number)
+    try:
+        return _checkout(quote_number)
+    except Quote.DoesNotExist:
+        if quote_writer.get_published(quote_number) is not None:
+            raise QuoteNotWritten(quote_number)
+        raise
+    except IntegrityError:
+        # A concurrent checkout inserted the policy first, on databases without
+        # row locks the unique constraint on the quote is the last line of defence
+        return Policy.objects.select_related("quote", "address").get(
+            quote__quote_number=quote_number
+        )
+
+
+async def acheckout(quote_number: str) -> Policy | None:
+    return await sync_to_async(checkout)(quote_number)
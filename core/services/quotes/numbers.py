@@ -0,0 +1,105 @@
+import math
+import os
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from core.models import Sequence
+
+QUOTE_NUMBER_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+QUOTE_NUMBER_LENGTH = 10
+QUOTE_NUMBER_SPACE = len(QUOTE_NUMBER_ALPHABET) ** QUOTE_NUMBER_LENGTH
+
+# value -> (value * multiplier + offset) mod space is a bijection of the quote
+# number space as long as the multiplier is coprime with it. Consecutive sequence
+# values still give unrelated looking quote numbers.
+QUOTE_NUMBER_MULTIPLIER = 1442695040888963407 % QUOTE_NUMBER_SPACE
+QUOTE_NUMBER_OFFSET = 0x2545F4914F6CDD1D % QUOTE_NUMBER_SPACE
+assert math.gcd(QUOTE_NUMBER_MULTIPLIER, QUOTE_NUMBER_SPACE) == 1
+
+QUOTE_NUMBER_SEQUENCE = "quote_number"
+
+
+def encode_quote_number(value: int) -> str:
+    if not 0 <= value < QUOTE_NUMBER_SPACE:
+        raise ValueError("Quote number sequence exhausted")
+    scrambled = (
+        value * QUOTE_NUMBER_MULTIPLIER + QUOTE_NUMBER_OFFSET
+    ) % QUOTE_NUMBER_SPACE
+    digits = []
+    for _ in range(QUOTE_NUMBER_LENGTH):
+        scrambled, digit = divmod(scrambled, len(QUOTE_NUMBER_ALPHABET))
+        digits.append(QUOTE_NUMBER_ALPHABET[digit])
+    return "".join(reversed(digits))
+
+
+def reserve_block(name: str, size: int) -> range:
+    """
+    Description:
+        Reserve ``size`` consecutive values of the ``name`` sequence. The row is
+        locked by the UPDATE until the transaction ends, so concurrent reservations
+        from any process or node get disjoint ranges.
+    """
+    with transaction.atomic():
+        if not Sequence.objects.filter(name=name).update(value=F("value") + size):
+            Sequence.objects.get_or_create(name=name)
+            Sequence.objects.filter(name=name).update(value=F("value") + size)
+        end = Sequence.objects.values_list("value", flat=True).get(name=name)
+    return range(end - size, end)
+
+
+class QuoteNumberAllocator:
+    """
+    Description:
+        Hands out quote numbers that can not collide, without a uniqueness check
+        query. Each process reserves blocks of ``block_size`` values of a database
+        sequence and encodes them into the 36 character alphabet, so the database is
+        only hit once per block.
+
+        A block reserved inside a transaction would be given back by a rollback
+        while the process still held it, so inside ``atomic`` blocks exactly the
+        requested numbers are reserved and nothing is kept for later calls.
+    """
+
+    def __init__(
+        self, name: str = QUOTE_NUMBER_SEQUENCE, block_size: int | None = None
+    ):
+        self.name = name
+        self.block_size = block_size or settings.QUOTE_NUMBER_BLOCK_SIZE
+        self._lock = threading.Lock()
+        self._block = range(0)
+        if hasattr(os, "register_at_fork"):
+            # A forked worker must not reuse the block of its parent
+            os.register_at_fork(after_in_child=self.reset)
+
+    def reset(self) -> None:
+        self._lock = threading.Lock()
+        self._block = range(0)
+
+    def allocate(self, count: int = 1) -> list[str]:
+        if count < 1:
+            return []
+        if connection.in_atomic_block:
+            return [
+                encode_quote_number(value) for value in reserve_block(self.name, count)
+            ]
+
+        values = []
+        with self._lock:
+            while len(values) < count:
+                if not self._block:
+                    self._block = reserve_block(
+                        self.name, max(self.block_size, count - len(values))
+                    )
+                taken = self._block[: count - len(values)]
+                values.extend(taken)
+                self._block = self._block[len(taken) :]
+        return [encode_quote_number(value) for value in values]
+
+
+quote_number_allocator = QuoteNumberAllocator()
+
+
+def next_quote_number() -> str:
+    return quote_number_allocator.allocate()[0]
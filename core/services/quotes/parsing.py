@@ -0,0 +1,96 @@
+"""
+Address tagging without any Django model import, so it can run in worker
+processes that never call ``django.setup()``. usaddress and its CRF model are
+imported on the first tag, not with the module.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+WARMUP_ADDRESS = "1600 Pennsylvania Avenue NW, Washington, DC 20500"
+
+
+class ParsedAddress(NamedTuple):
+    address: str
+    state: str
+    zip_code: str
+
+
+def tag_address(raw_address: str) -> ParsedAddress:
+    import usaddress
+
+    data = usaddress.tag(raw_address)[0]
+    return ParsedAddress(
+        address=(
+            f"{data['AddressNumber']} {data['StreetName']} "
+            f"{data['StreetNamePostType']} {data['StreetNamePostDirectional']}"
+        ),
+        state=data["StateName"],
+        zip_code=data["ZipCode"],
+    )
+
+
+def tag_address_or_none(raw_address: str) -> ParsedAddress | None:
+    import usaddress
+
+    try:
+        return tag_address(raw_address)
+    except (usaddress.RepeatedLabelError, KeyError):
+        return None
+
+
+def tag_addresses(raw_addresses: list[str]) -> list[ParsedAddress | None]:
+    return [tag_address_or_none(raw_address) for raw_address in raw_addresses]
+
+
+def _init_worker() -> None:
+    # Load the CRF model once per worker instead of on its first chunk
+    import usaddress
+
+    usaddress.tag(WARMUP_ADDRESS)
+
+
+class ParallelAddressTagger:
+    """
+    Description:
+        Tag batches of raw addresses on a pool of worker processes, so large imports
+        are not bound to the one core the GIL allows. A drop in replacement for
+        ``tag_addresses``: results come back in input order, ``None`` for the
+        addresses that can not be tagged.
+
+        Workers are spawned rather than forked, they never inherit the parent's
+        database connections. Use it as a context manager to reuse one pool across
+        batches.
+    """
+
+    def __init__(self, workers: int | None = None, chunk_size: int = 64) -> None:
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self._pool = None
+
+    def __enter__(self) -> "ParallelAddressTagger":
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __call__(self, raw_addresses: list[str]) -> list[ParsedAddress | None]:
+        if self._pool is None:
+            with self:
+                return self(raw_addresses)
+        return list(
+            self._pool.map(
+                tag_address_or_none, raw_addresses, chunksize=self.chunk_size
+            )
+        )
@@ -1,14 +1,46 @@
-import usaddress
+import asyncio
+import functools
+import hashlib
+import json
+import sqlite3
+import uuid
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from typing import Callable, NamedTuple
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from core.models import Quote, Address
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from core import metrics
+from core.cache import MISSING, LRUCache
+from core.models import Quote, Address, address_hash
 from core.constants import active_volcanos_states
-from django.utils.crypto import get_random_string
-
-from core.validators import zip_code_validator, state_validator
+from core.sqlite import retry_on_locked
+from core.services.quotes.parsing import ParsedAddress, tag_address, tag_addresses
+from core.services.quotes.numbers import next_quote_number, quote_number_allocator
+from core.services.quotes.write_behind import quote_writer
+
+from core.validators import (
+    UNPARSEABLE_ADDRESS,
+    VALID,
+    zip_code_validator,
+    state_validator,
+    validate_zip_codes,
+    validate_states,
+)
 
 logger = logging.getLogger(__name__)
 
+# A full batch resolves its addresses in one lookup and one upsert
+ADDRESS_LOOKUP_CHUNK_SIZE = settings.QUOTE_BATCH_MAX_SIZE
+QUOTE_NUMBER_ATTEMPTS = 3
+
+# Money fields are stored with 2 decimal places
+CENT = Decimal("0.01")
+
 term = 6
 monthly_base_volcano_policy_price = 59.94
 
@@ -20,31 +52,225 @@ def is_in_danger_zone(state: str) -> bool:
         return False
 
 
-def address_parser(raw_address: str) -> Address | None:
+def normalize_raw_address(raw_address: str) -> str:
+    # Only spacing is collapsed: tagging and ``state_validator`` are case sensitive,
+    # so addresses differing in case may not parse the same
+    return " ".join(raw_address.split())
+
+
+address_cache = LRUCache(
+    max_size=settings.ADDRESS_CACHE_MAX_SIZE, ttl=settings.ADDRESS_CACHE_TTL
+)
+
+
+@metrics.timed("parse_address")
+def parse_address(raw_address: str) -> ParsedAddress | None:
+    """
+    Description:
+        Tag and validate a raw address, going through ``address_cache`` first.
+        Invalid addresses are cached as ``None`` so they are not tagged again,
+        or as their error codes by ``parse_addresses``.
+    """
+    from usaddress import RepeatedLabelError
+
+    key = normalize_raw_address(raw_address)
+    parsed = address_cache.get(key, MISSING)
+    if parsed is not MISSING:
+        return parsed if isinstance(parsed, ParsedAddress) else None
 
     try:
-        parse_address = usaddress.tag(raw_address)
-        data = parse_address[0]
+        with metrics.stage_timer("usaddress"):
+            parsed = tag_address(raw_address)
+        zip_code_validator(parsed.zip_code)
+        state_validator(parsed.state)
+    except (ValidationError, RepeatedLabelError, KeyError) as ex:
+        logger.warning(msg="Validation issue", exc_info=ex)
+        parsed = None
 
-        zip_code = data["ZipCode"]
-        zip_code_validator(zip_code)
+    address_cache.set(key, parsed)
+    return parsed
 
-        state_name = data["StateName"]
-        state_validator(state_name)
 
-        address = (
-            f"{data['AddressNumber']} {data['StreetName']} "
-            f"{data['StreetNamePostType']} {data['StreetNamePostDirectional']}"
-        )
+# Bounded pool running parse_address for the async views
+address_parser_executor = ThreadPoolExecutor(
+    max_workers=settings.ADDRESS_PARSER_THREADS, thread_name_prefix="address-parser"
+)
+
+
+UPSERT_ADDRESS_SQL = """
+    INSERT INTO {table} (id, created_at, updated_at, address, state, zip_code, address_hash)
+    VALUES {values}
+    ON CONFLICT (address_hash) DO NOTHING
+    RETURNING *
+"""
 
+
+def supports_upsert_returning() -> bool:
+    return connection.vendor == "postgresql" or (
+        connection.vendor == "sqlite" and sqlite3.sqlite_version_info >= (3, 35)
+    )
+
+
+@metrics.timed("upsert_address")
+def upsert_address(parsed: ParsedAddress) -> Address:
+    """
+    Description:
+        Race safe ``get_or_create`` of an address on its unique ``address_hash``.
+        Existing addresses, the common case, cost one indexed SELECT and take no
+        row lock, only new ones are upserted.
+    """
+    key = address_hash(*parsed)
+    address = Address.objects.filter(address_hash=key).first()
+    if address is not None:
+        return address
+    if not supports_upsert_returning():
         addr, _ = Address.objects.get_or_create(
-            address=address, state=state_name, zip_code=zip_code
+            address_hash=key, defaults=parsed._asdict()
         )
         return addr
-    except ValidationError as ex:
-        logger.warning(msg="Validation issue", exc_info=ex)
+
+    return upsert_addresses({key: parsed})[0]
+
+
+def upsert_addresses(rows: dict[str, ParsedAddress]) -> list[Address]:
+    """
+    Description:
+        Insert the addresses of ``rows`` (keyed by ``address_hash``) in one
+        statement, on databases where ``supports_upsert_returning()``. Conflicting
+        rows are left untouched and not returned by the INSERT, they were created
+        concurrently and are fetched afterwards.
+    """
+    now = timezone.now()
+    fields = {field.attname: field for field in Address._meta.concrete_fields}
+    params = []
+    for key, parsed in rows.items():
+        values = {
+            "id": uuid.uuid4(),
+            "created_at": now,
+            "updated_at": now,
+            **parsed._asdict(),
+            "address_hash": key,
+        }
+        params.extend(
+            fields[name].get_db_prep_value(value, connection, prepared=False)
+            for name, value in values.items()
+        )
+    sql = UPSERT_ADDRESS_SQL.format(
+        table=connection.ops.quote_name(Address._meta.db_table),
+        values=", ".join(["(%s, %s, %s, %s, %s, %s, %s)"] * len(rows)),
+    )
+    addresses = list(Address.objects.raw(sql, params))
+    conflicts = set(rows) - {address.address_hash for address in addresses}
+    if conflicts:
+        addresses.extend(
+            Address.objects.in_bulk(conflicts, field_name="address_hash").values()
+        )
+    return addresses
+
+
+@metrics.timed("address_parser")
+def address_parser(raw_address: str) -> Address | None:
+    parsed = parse_address(raw_address)
+    if parsed is None:
         return None
 
+    return upsert_address(parsed)
+
+
+def resolve_addresses(rows: set[ParsedAddress]) -> dict[ParsedAddress, Address]:
+    """
+    Description:
+        Bulk version of ``upsert_address``, fetching the existing addresses by
+        ``address_hash`` in chunks and upserting the missing ones in one statement
+        per chunk. Without upsert support they are inserted with ``bulk_create``,
+        skipping the rows inserted concurrently by another request, and fetched
+        afterwards.
+    """
+    hashes = {row: address_hash(*row) for row in rows}
+    keys = list(set(hashes.values()))
+    by_hash = {}
+    for start in range(0, len(keys), ADDRESS_LOOKUP_CHUNK_SIZE):
+        chunk = keys[start : start + ADDRESS_LOOKUP_CHUNK_SIZE]
+        by_hash.update(Address.objects.in_bulk(chunk, field_name="address_hash"))
+
+    missing = {key: row for row, key in hashes.items() if key not in by_hash}
+    if missing and supports_upsert_returning():
+        keys = list(missing)
+        for start in range(0, len(keys), ADDRESS_LOOKUP_CHUNK_SIZE):
+            chunk = keys[start : start + ADDRESS_LOOKUP_CHUNK_SIZE]
+            upserted = upsert_addresses({key: missing[key] for key in chunk})
+            by_hash.update((address.address_hash, address) for address in upserted)
+    elif missing:
+        Address.objects.bulk_create(
+            [
+                Address(**row._asdict(), address_hash=key)
+                for key, row in missing.items()
+            ],
+            ignore_conflicts=True,
+        )
+        keys = list(missing)
+        for start in range(0, len(keys), ADDRESS_LOOKUP_CHUNK_SIZE):
+            chunk = keys[start : start + ADDRESS_LOOKUP_CHUNK_SIZE]
+            by_hash.update(Address.objects.in_bulk(chunk, field_name="address_hash"))
+
+    return {row: by_hash[key] for row, key in hashes.items()}
+
+
+def parse_addresses(
+    raw_addresses: list[str],
+    tagger: Callable[[list[str]], list[ParsedAddress | None]] = tag_addresses,
+) -> tuple[list[Address | None], list[tuple[int, ...]]]:
+    """
+    Description:
+        Bulk version of ``address_parser``. Addresses missing from ``address_cache``
+        are tagged by ``tagger`` (e.g. a ``ParallelAddressTagger`` for large batches)
+        and have their zip codes and states validated at once, and every distinct
+        address is resolved a single time. Invalid addresses are cached as their
+        error codes.
+
+    Returns:
+        tuple: the ``Address`` of each raw address, in input order, ``None`` for
+        the ones that could not be parsed or are not valid, and the error codes of
+        each raw address (``UNPARSEABLE_ADDRESS`` or those of the bulk validators,
+        empty for the valid ones).
+    """
+    keys = [normalize_raw_address(raw_address) for raw_address in raw_addresses]
+    parsed = {}
+    untagged = {}
+    for key, raw_address in zip(keys, raw_addresses):
+        if key in parsed or key in untagged:
+            continue
+        cached = address_cache.get(key, MISSING)
+        # Cached as None by parse_address, without the reason
+        if cached is not MISSING and cached is not None:
+            parsed[key] = cached
+        else:
+            untagged[key] = raw_address
+
+    tagged = {}
+    for key, row in zip(untagged, tagger(list(untagged.values()))):
+        if row is None:
+            parsed[key] = (UNPARSEABLE_ADDRESS,)
+        else:
+            tagged[key] = row
+
+    rows = list(tagged.values())
+    _, zip_code_errors = validate_zip_codes([row.zip_code for row in rows])
+    _, state_errors = validate_states([row.state for row in rows])
+    for key, row, *row_errors in zip(tagged, rows, zip_code_errors, state_errors):
+        codes = tuple(int(code) for code in row_errors if code != VALID)
+        parsed[key] = codes or row
+
+    for key in untagged:
+        address_cache.set(key, parsed[key])
+
+    addresses = resolve_addresses(
+        {row for row in parsed.values() if isinstance(row, ParsedAddress)}
+    )
+    return [addresses.get(parsed[key]) for key in keys], [
+        () if isinstance(parsed[key], ParsedAddress) else parsed[key] for key in keys
+    ]
+
 
 def additional_fees(had_previously_cancel_volcano_policy: bool, state: str) -> list:
     additional_fees_array = []
@@ -97,6 +323,167 @@ def additional_discounts(never_cancel_volcano_policy: bool, new_property: bool)
     return additional_discounts_array
 
 
+class Rating(NamedTuple):
+    base_monthly_premium: float
+    total_monthly_fee: float
+    total_monthly_discount: float
+    total_monthly_premium: float
+    total_term_premium: float
+
+
+# Bits of a rating table index, one per pricing input
+HAD_PREVIOUSLY_CANCEL_VOLCANO_POLICY = 1
+IN_DANGER_ZONE = 2
+NEVER_CANCEL_VOLCANO_POLICY = 4
+NEW_PROPERTY = 8
+RATING_TABLE_SIZE = 16
+
+
+def rating_index(
+    had_previously_cancel_volcano_policy: bool,
+    in_danger_zone: bool,
+    never_cancel_volcano_policy: bool,
+    new_property: bool,
+) -> int:
+    return (
+        HAD_PREVIOUSLY_CANCEL_VOLCANO_POLICY
+        * bool(had_previously_cancel_volcano_policy)
+        | IN_DANGER_ZONE * bool(in_danger_zone)
+        | NEVER_CANCEL_VOLCANO_POLICY * bool(never_cancel_volcano_policy)
+        | NEW_PROPERTY * bool(new_property)
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def rating_table(base_monthly_premium: float, term: int) -> tuple[Rating, ...]:
+    """
+    Description:
+        Every possible rating for a base price and term, indexed by ``rating_index``.
+        Cached per (base price, term), so a price or term change builds a new table.
+    """
+    # Any state with an active volcano stands in for the whole danger zone
+    danger_zone_state = next(iter(active_volcanos_states))
+    table = []
+    for index in range(RATING_TABLE_SIZE):
+        fees = additional_fees(
+            bool(index & HAD_PREVIOUSLY_CANCEL_VOLCANO_POLICY),
+            danger_zone_state if index & IN_DANGER_ZONE else "",
+        )
+        discounts = additional_discounts(
+            bool(index & NEVER_CANCEL_VOLCANO_POLICY), bool(index & NEW_PROPERTY)
+        )
+
+        total_monthly_fee = calculate_additional_fees(fees, base_monthly_premium)
+
+        total_monthly_discount = calculate_total_discount(
+            discounts, base_monthly_premium
+        )
+
+        total_monthly = (
+            base_monthly_premium
+            + (base_monthly_premium * total_monthly_fee)
+            + (base_monthly_premium * total_monthly_discount)
+        ) or base_monthly_premium
+
+        table.append(
+            Rating(
+                base_monthly_premium=base_monthly_premium,
+                total_monthly_fee=total_monthly_fee,
+                total_monthly_discount=total_monthly_discount,
+                total_monthly_premium=total_monthly,
+                total_term_premium=total_monthly * term,
+            )
+        )
+    return tuple(table)
+
+
+@metrics.timed("build_quote")
+def build_quote(
+    address: Address,
+    had_previously_cancel_volcano_policy: bool,
+    never_cancel_volcano_policy: bool,
+    new_property: bool,
+    previously_cancel_policy: bool = False,
+    quote_number: str | None = None,
+) -> Quote:
+    """
+    Description:
+        Price a quote for an already resolved address, without saving it.
+    """
+    quote_number = quote_number or next_quote_number()
+    rating = rating_table(monthly_base_volcano_policy_price, term)[
+        rating_index(
+            had_previously_cancel_volcano_policy,
+            is_in_danger_zone(address.state),
+            never_cancel_volcano_policy,
+            new_property,
+        )
+    ]
+
+    return Quote(
+        quote_number=quote_number,
+        previously_cancel_policy=previously_cancel_policy,
+        total_term_premium=to_money(rating.total_term_premium),
+        total_monthly_premium=to_money(rating.total_monthly_premium),
+        total_monthly_fee=to_money(rating.total_monthly_fee),
+        total_monthly_discount=to_money(rating.total_monthly_discount),
+        address=address,
+    )
+
+
+def to_money(value: float) -> Decimal:
+    # The value the database stores, so an unsaved quote reads the same
+    return Decimal(str(value)).quantize(CENT)
+
+
+@metrics.timed("insert_quotes")
+@retry_on_locked
+def insert_quotes(quotes: list[Quote]) -> None:
+    """
+    Description:
+        Insert quotes whose numbers came from ``quote_number_allocator``. Allocated
+        numbers never collide with each other, only with the random numbers of
+        quotes created before the allocator, so a clash just draws new numbers for
+        the clashing quotes. Any other integrity error is raised.
+    """
+    for attempt in range(QUOTE_NUMBER_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                Quote.objects.bulk_create(quotes)
+            return
+        except IntegrityError:
+            taken = set(
+                Quote.objects.filter(
+                    quote_number__in=[quote.quote_number for quote in quotes]
+                ).values_list("quote_number", flat=True)
+            )
+            if not taken or attempt == QUOTE_NUMBER_ATTEMPTS - 1:
+                raise
+            clashing = [quote for quote in quotes if quote.quote_number in taken]
+            numbers = quote_number_allocator.allocate(len(clashing))
+            for quote, quote_number in zip(clashing, numbers):
+                quote.quote_number = quote_number
+
+
+def save_quote(quote: Quote) -> Quote:
+    """
+    Description:
+        Insert a new quote, or with ``settings.QUOTE_WRITE_BEHIND`` hand it to
+        ``quote_writer`` and return at once. Database errors are raised, callers
+        answer ``None`` only for an invalid address.
+    """
+    if settings.QUOTE_WRITE_BEHIND:
+        # Stamped now for the reads served before the flush, the row is written
+        # with the same timestamps
+        quote.created_at = quote.updated_at = timezone.now()
+        payload = quote_payload(quote)
+        quote_writer.submit(quote, published=(quote_etag(payload), payload))
+    else:
+        insert_quotes([quote])
+    return quote
+
+
+@metrics.timed("create_quote")
 def create_quote(
     had_previously_cancel_volcano_policy: bool,
     never_cancel_volcano_policy: bool,
@@ -106,39 +493,182 @@ def create_quote(
 ) -> Quote | None:
 
     address = address_parser(address)
+    if address is None:
+        return None
 
-    quote_number = get_random_string(
-        length=10, allowed_chars="ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+    quote = build_quote(
+        address=address,
+        had_previously_cancel_volcano_policy=had_previously_cancel_volcano_policy,
+        never_cancel_volcano_policy=never_cancel_volcano_policy,
+        new_property=new_property,
+        previously_cancel_policy=previously_cancel_policy,
     )
-    fees = additional_fees(had_previously_cancel_volcano_policy, address.state)
-    discounts = additional_discounts(never_cancel_volcano_policy, new_property)
 
-    base_monthly_premium = monthly_base_volcano_policy_price
+    return save_quote(quote)
 
-    total_monthly_fee = calculate_additional_fees(fees, base_monthly_premium)
 
-    total_monthly_discount = calculate_total_discount(discounts, base_monthly_premium)
+def _create_quote_for(parsed: ParsedAddress, **pricing) -> Quote:
+    address = upsert_address(parsed)
+    quote = build_quote(address=address, **pricing)
+    return save_quote(quote)
 
-    total_monthly = (
-        base_monthly_premium
-        + (base_monthly_premium * total_monthly_fee)
-        + (base_monthly_premium * total_monthly_discount)
-    ) or base_monthly_premium
 
-    try:
-        return Quote.objects.create(
-            quote_number=quote_number,
-            previously_cancel_policy=previously_cancel_policy,
-            total_term_premium=total_monthly * term,
-            total_monthly_premium=total_monthly,
-            total_monthly_fee=total_monthly_fee,
-            total_monthly_discount=total_monthly_discount,
+async def acreate_quote(
+    had_previously_cancel_volcano_policy: bool,
+    never_cancel_volcano_policy: bool,
+    new_property: bool,
+    previously_cancel_policy: bool = False,
+    address: str = "1600 Pennsylvania Avenue NW, Washington, DC 20500",
+) -> Quote | None:
+    """
+    Description:
+        Async version of ``create_quote``. The CPU bound address tagging runs on
+        ``address_parser_executor`` so the event loop keeps serving other requests.
+
+    Returns:
+        Quote | None: ``None`` when the address is not valid.
+    """
+    loop = asyncio.get_running_loop()
+    parsed = await loop.run_in_executor(address_parser_executor, parse_address, address)
+    if parsed is None:
+        return None
+
+    return await sync_to_async(_create_quote_for)(
+        parsed,
+        had_previously_cancel_volcano_policy=had_previously_cancel_volcano_policy,
+        never_cancel_volcano_policy=never_cancel_volcano_policy,
+        new_property=new_property,
+        previously_cancel_policy=previously_cancel_policy,
+    )
+
+
+@retry_on_locked
+def create_quotes(
+    quote_inputs: list[dict],
+    tagger: Callable[[list[str]], list[ParsedAddress | None]] = tag_addresses,
+) -> tuple[list[Quote | None], list[tuple[int, ...]]]:
+    """
+    Description:
+        Bulk version of ``create_quote``. Every address of the batch is parsed
+        (tagged by ``tagger``) and resolved at once, then the quotes of the valid
+        addresses get their numbers and are written with a single ``bulk_create``
+        inside one transaction.
+
+    Returns:
+        tuple: the created ``Quote`` of each input, in input order, ``None`` for the
+        ones whose address is not valid, and the error codes of each address, see
+        ``parse_addresses``.
+    """
+    # Addresses are upserted race safely on their own, the ones of a batch that
+    # fails to insert are reused by the next quotes for them
+    addresses, errors = parse_addresses(
+        [quote_input["address"] for quote_input in quote_inputs], tagger=tagger
+    )
+    # Allocated outside any transaction, so whole blocks can be reserved, and only
+    # for the valid addresses
+    quote_numbers = iter(
+        quote_number_allocator.allocate(
+            sum(address is not None for address in addresses)
+        )
+    )
+    quotes = [
+        None
+        if address is None
+        else build_quote(
             address=address,
+            had_previously_cancel_volcano_policy=quote_input[
+                "had_previously_cancel_volcano_policy"
+            ],
+            never_cancel_volcano_policy=quote_input["never_cancel_volcano_policy"],
+            new_property=quote_input["new_property"],
+            previously_cancel_policy=quote_input.get("previously_cancel_policy", False),
+            quote_number=next(quote_numbers),
         )
-    except Exception as ex:
-        logger.error(msg="Failed to create policy", exc_info=ex)
+        for quote_input, address in zip(quote_inputs, addresses)
+    ]
+    insert_quotes([quote for quote in quotes if quote is not None])
+    return quotes, errors
+
+
+def quote_cache_key(quote_number: str) -> str:
+    return f"quote:{quote_number}"
+
+
+def quote_payload(quote: Quote) -> dict:
+    return {
+        "quote_number": quote.quote_number,
+        "policy_holder": quote.policy_holder,
+        "previously_cancel_policy": quote.previously_cancel_policy,
+        "total_term_premium": str(quote.total_term_premium),
+        "total_monthly_premium": str(quote.total_monthly_premium),
+        "total_monthly_fee": str(quote.total_monthly_fee),
+        "total_monthly_discount": str(quote.total_monthly_discount),
+        "address": {
+            "address": quote.address.address,
+            "state": quote.address.state,
+            "zip_code": quote.address.zip_code,
+        },
+        "created_at": quote.created_at.isoformat(),
+        "updated_at": quote.updated_at.isoformat(),
+    }
+
+
+def quote_etag(payload: dict) -> str:
+    digest = hashlib.sha256(
+        json.dumps(payload, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    return f'"{digest}"'
+
+
+def get_cached_quote(quote_number: str) -> tuple[str, dict] | None:
+    """
+    Description:
+        Cached ``(etag, payload)`` of a quote, without touching the database.
+    """
+    return cache.get(quote_cache_key(quote_number))
+
+
+def get_quote(quote_number: str) -> tuple[str, dict] | None:
+    """
+    Description:
+        Read through cache of the quote payloads served by the quote detail endpoint,
+        with their strong ETag. Entries are dropped by ``invalidate_quote`` when the
+        quote changes. Quotes still queued by ``quote_writer`` are served from
+        memory, or from the entry it published when another worker queued them,
+        and not cached, their timestamps change when they are written.
+
+    Returns:
+        tuple | None: ``(etag, payload)``, ``None`` when the quote does not exist.
+    """
+    cached = get_cached_quote(quote_number)
+    if cached is not None:
+        return cached
+
+    pending = quote_writer.get(quote_number)
+    if pending is not None:
+        payload = quote_payload(pending)
+        return quote_etag(payload), payload
+
+    published = quote_writer.get_published(quote_number)
+    if published is not None:
+        return published
+
+    quote = (
+        Quote.objects.select_related("address")
+        .filter(quote_number=quote_number)
+        .first()
+    )
+    if quote is None:
+        return None
+
+    payload = quote_payload(quote)
+    cached = (quote_etag(payload), payload)
+    cache.set(quote_cache_key(quote_number), cached, settings.QUOTE_CACHE_TIMEOUT)
+    return cached
+
 
-    return None
+def invalidate_quote(quote_number: str) -> None:
+    cache.delete(quote_cache_key(quote_number))
 
 
 def calculate_total_discount(discounts, total_monthly_premium) -> float:
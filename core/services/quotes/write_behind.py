@@ -0,0 +1,288 @@
+"""
+Write-behind persistence of quotes, on with ``settings.QUOTE_WRITE_BEHIND``. A
+quote is answered as soon as it is priced, its number comes from the allocator
+and is final, and a background thread inserts the queued quotes with one
+``bulk_create`` per batch.
+
+Quotes are kept in memory until they are written, so the process that created
+one serves it and checks it out as usual. Each queued quote is also published to
+the shared cache under ``pending_quote_cache_key``, so the other workers serve it
+too and answer its checkout with a retryable ``QuoteNotWritten`` until it is
+flushed, usually ``settings.QUOTE_WRITE_BEHIND_FLUSH_INTERVAL`` seconds later.
+The queue is written out when the process exits, ``manage.py serve`` workers
+close it before they stop. Quotes that could not be written are logged and
+counted in ``/metrics``.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import (
+    DatabaseError,
+    IntegrityError,
+    close_old_connections,
+    connection,
+    connections,
+    transaction,
+)
+from core import metrics
+from core.models import Quote
+from core.sqlite import retry_on_locked
+
+logger = logging.getLogger(__name__)
+
+# Queue markers, ask the writer to flush its batch now or to stop
+FLUSH = object()
+STOP = object()
+
+# Seconds between attempts to write a batch while the database is unavailable
+RETRY_INTERVAL = 1.0
+
+# Seconds ``QuoteWriter.wait`` waits for a flush by default
+WAIT_TIMEOUT = 10.0
+
+
+class QuoteNotWritten(Exception):
+    """
+    Description:
+        The quote is still queued, in this process and the database did not take
+        it within the wait timeout, or in another worker. Worth retrying later.
+    """
+
+
+def pending_quote_cache_key(quote_number: str) -> str:
+    return f"quote:{quote_number}:pending"
+
+
+def dropped(quotes: list[Quote], reason: str) -> None:
+    logger.error(
+        "Dropped %d quotes: %s",
+        len(quotes),
+        ", ".join(quote.quote_number for quote in quotes),
+    )
+    if metrics.enabled():
+        metrics.registry.increment(metrics.WRITE_BEHIND_DROPPED, reason, len(quotes))
+
+
+@metrics.timed("write_behind_flush")
+@retry_on_locked
+def write_quotes(quotes: list[Quote]) -> None:
+    # A raw insert, like loaddata, keeps the created_at and updated_at stamped
+    # before the quote was published instead of stamping them again
+    fields = Quote._meta.concrete_fields
+    batch_size = max(connection.ops.bulk_batch_size(fields, quotes), 1)
+    with transaction.atomic():
+        for start in range(0, len(quotes), batch_size):
+            Quote.objects._insert(quotes[start : start + batch_size], fields, raw=True)
+    for quote in quotes:
+        quote._state.adding = False
+        quote._state.db = connection.alias
+
+
+class QuoteWriter:
+    """
+    Description:
+        Queue of quotes written by a background thread, in batches of up to
+        ``settings.QUOTE_WRITE_BEHIND_BATCH_SIZE`` collected for at most
+        ``settings.QUOTE_WRITE_BEHIND_FLUSH_INTERVAL`` seconds.
+
+        The queue holds ``settings.QUOTE_WRITE_BEHIND_QUEUE_SIZE`` quotes. When
+        it is full ``submit`` waits up to ``settings.QUOTE_WRITE_BEHIND_PUT_TIMEOUT``
+        seconds for room and then writes the quote itself, so callers slow down
+        to the pace of the database instead of piling up memory.
+    """
+
+    def __init__(self) -> None:
+        self.reset()
+        if hasattr(os, "register_at_fork"):
+            # The writer thread is not forked, a worker starts its own
+            os.register_at_fork(after_in_child=self.reset)
+
+    def reset(self) -> None:
+        self._lock = threading.Lock()
+        self._flushed = threading.Condition(self._lock)
+        self._pending: dict[str, Quote] = {}
+        self._queue = None
+        self._thread = None
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if self._queue is None or self._queue.empty():
+                self._queue = queue.Queue(
+                    maxsize=settings.QUOTE_WRITE_BEHIND_QUEUE_SIZE
+                )
+            # else a writer died with quotes still queued, its successor writes them
+            self._thread = threading.Thread(
+                target=self._run, name="quote-writer", daemon=True
+            )
+            self._thread.start()
+
+    def submit(self, quote: Quote, published: tuple[str, dict]) -> None:
+        """
+        Description:
+            Queue ``quote`` to be written, or write it now when the queue stays
+            full. Its number must come from ``quote_number_allocator``, the writer
+            can not draw a new one after it was handed out. ``published`` is the
+            ``(etag, payload)`` the other workers serve until it is written.
+        """
+        self._start()
+        with self._lock:
+            self._pending[quote.quote_number] = quote
+        cache.set(
+            pending_quote_cache_key(quote.quote_number),
+            published,
+            settings.QUOTE_WRITE_BEHIND_PENDING_TIMEOUT,
+        )
+        try:
+            self._queue.put(quote, timeout=settings.QUOTE_WRITE_BEHIND_PUT_TIMEOUT)
+        except queue.Full:
+            try:
+                write_quotes([quote])
+            finally:
+                self._done([quote])
+
+    def get(self, quote_number: str) -> Quote | None:
+        """
+        Description:
+            The quote if it is still waiting to be written by this process.
+        """
+        with self._lock:
+            return self._pending.get(quote_number)
+
+    def get_published(self, quote_number: str) -> tuple[str, dict] | None:
+        """
+        Description:
+            ``(etag, payload)`` of a quote still waiting to be written by any
+            worker, from the shared cache.
+        """
+        return cache.get(pending_quote_cache_key(quote_number))
+
+    def wait(
+        self, quote_number: str | None = None, timeout: float = WAIT_TIMEOUT
+    ) -> bool:
+        """
+        Description:
+            Flush now and wait until ``quote_number`` (every pending quote when
+            ``None``) is written. ``False`` when that took over ``timeout`` seconds.
+        """
+        with self._lock:
+            if not self._is_pending(quote_number):
+                return True
+        self._start()
+        try:
+            self._queue.put_nowait(FLUSH)
+        except queue.Full:
+            pass  # The writer is busy flushing already
+        with self._lock:
+            return self._flushed.wait_for(
+                lambda: not self._is_pending(quote_number), timeout=timeout
+            )
+
+    def _is_pending(self, quote_number: str | None) -> bool:
+        return quote_number in self._pending if quote_number else bool(self._pending)
+
+    def close(self) -> None:
+        """
+        Description:
+            Write every queued quote and stop the writer, giving up after
+            ``settings.QUOTE_WRITE_BEHIND_SHUTDOWN_TIMEOUT`` seconds.
+        """
+        with self._lock:
+            thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(STOP)
+        thread.join(settings.QUOTE_WRITE_BEHIND_SHUTDOWN_TIMEOUT)
+        with self._lock:
+            lost = list(self._pending.values())
+            self._thread = None
+        if lost:
+            dropped(lost, "shutdown")
+            self._done(lost)
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self._write(batch, stopping)
+            except Exception:
+                # The thread must outlive any batch, a dead writer would leave
+                # every later quote pending
+                logger.exception("Failed to write %d quotes", len(batch))
+                dropped(batch, "error")
+                self._done(batch)
+        connections.close_all()
+
+    def _next_batch(self) -> tuple[list[Quote], bool]:
+        batch = []
+        item = self._queue.get()
+        deadline = time.monotonic() + settings.QUOTE_WRITE_BEHIND_FLUSH_INTERVAL
+        while True:
+            if item is STOP:
+                return batch, True
+            if item is FLUSH:
+                return batch, False
+            batch.append(item)
+            if len(batch) >= settings.QUOTE_WRITE_BEHIND_BATCH_SIZE:
+                return batch, False
+            try:
+                item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                return batch, False
+
+    def _write(self, batch: list[Quote], stopping: bool) -> None:
+        deadline = time.monotonic() + settings.QUOTE_WRITE_BEHIND_SHUTDOWN_TIMEOUT
+        while True:
+            # A long lived thread, drop connections past CONN_MAX_AGE or broken
+            close_old_connections()
+            try:
+                write_quotes(batch)
+                break
+            except IntegrityError:
+                # The numbers were already handed out, they can not be redrawn
+                self._write_one_by_one(batch)
+                break
+            except DatabaseError:
+                logger.exception("Failed to write %d quotes, retrying", len(batch))
+                if stopping and time.monotonic() > deadline:
+                    return
+                time.sleep(RETRY_INTERVAL)
+            except Exception:
+                # Not the database, retrying would fail the same way. Write the
+                # quotes that can be written and give up on the others
+                logger.exception("Failed to write %d quotes", len(batch))
+                self._write_one_by_one(batch)
+                break
+        self._done(batch)
+
+    def _write_one_by_one(self, batch: list[Quote]) -> None:
+        for quote in batch:
+            try:
+                write_quotes([quote])
+            except Exception:
+                logger.exception("Failed to write quote %s", quote.quote_number)
+                dropped([quote], "error")
+
+    def _done(self, quotes: list[Quote]) -> None:
+        # Written or given up on, either way the database is the truth now
+        cache.delete_many(
+            [pending_quote_cache_key(quote.quote_number) for quote in quotes]
+        )
+        with self._lock:
+            for quote in quotes:
+                self._pending.pop(quote.quote_number, None)
+            self._flushed.notify_all()
+
+
+quote_writer = QuoteWriter()
+atexit.register(quote_writer.close)
@@ -1,10 +1,42 @@
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from rest_framework.authtoken.models import Token
+from core.authentication import revoke_cached_tokens
+from core.models import Quote
+from core.services.quotes.services import invalidate_quote
 
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_auth_token(sender, instance=None, created=False, **kwargs):
     if created:
         Token.objects.create(user=instance)
+
+
+@receiver(post_save, sender=Quote)
+@receiver(post_delete, sender=Quote)
+def invalidate_cached_quote(sender, instance=None, **kwargs):
+    invalidate_quote(instance.quote_number)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_cached_token(sender, instance=None, **kwargs):
+    revoke_cached_tokens([instance.key])
+
+
+# User fields the cached tokens authenticate or authorize with
+TOKEN_USER_FIELDS = frozenset({"password", "is_active", "is_staff", "is_superuser"})
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_tokens(
+    sender, instance=None, created=False, update_fields=None, **kwargs
+):
+    # A full save may have changed any of them, the next request loads the user
+    # again. Saves of other fields only, like the last_login of every login, keep
+    # the tokens and skip their query
+    if created or (update_fields is not None and not TOKEN_USER_FIELDS & update_fields):
+        return
+    revoke_cached_tokens(
+        list(Token.objects.filter(user=instance).values_list("key", flat=True))
+    )
@@ -0,0 +1,95 @@
+"""
+SQLite tuned for concurrent writers on a single node. With
+``settings.SQLITE_CONCURRENCY_MODE`` every new connection switches to the WAL
+journal, where readers no longer block the writer, with ``synchronous=NORMAL``,
+a busy timeout, memory mapped reads and a larger page cache.
+
+SQLite still allows one writer at a time, and a transaction that read before it
+writes can not wait for the lock, it fails at once with "database is locked".
+``retry_on_locked`` runs such transactions again after a randomized
+exponential backoff.
+"""
+import functools
+import random
+import sqlite3
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from core import metrics
+
+LOCKED_ERRORS = ("database is locked", "database table is locked")
+
+
+def pragmas() -> list[str]:
+    return [
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT}",
+        f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}",
+        # Negative sizes are in KiB rather than pages
+        f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE}",
+    ]
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != "sqlite" or not settings.SQLITE_CONCURRENCY_MODE:
+        return
+    # On the driver connection, so they stay out of query counts and logs
+    for pragma in pragmas():
+        connection.connection.execute(pragma)
+
+
+def max_query_params(driver_connection) -> int:
+    # Python 3.11 reads the limit of the connection, before that assume the
+    # compile time default of the linked SQLite
+    if hasattr(driver_connection, "getlimit"):
+        return driver_connection.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+    return 32766 if sqlite3.sqlite_version_info >= (3, 32) else 999
+
+
+@receiver(connection_created)
+def configure_query_params(sender, connection, **kwargs):
+    # Django 4.2 assumes the 999 variables of SQLite before 3.32 and splits a
+    # full quote batch into several INSERTs of 90 rows
+    if connection.vendor == "sqlite":
+        connection.features.max_query_params = max_query_params(connection.connection)
+
+
+def is_locked(exc: Exception) -> bool:
+    return isinstance(exc, OperationalError) and str(exc).startswith(LOCKED_ERRORS)
+
+
+def retry_on_locked(func):
+    """
+    Description:
+        Run the decorated write transaction again, up to
+        ``settings.SQLITE_WRITE_RETRIES`` times, when SQLite reports the database
+        locked. The n-th retry waits a random time up to
+        ``settings.SQLITE_RETRY_BACKOFF * 2 ** n`` seconds, so the writers that
+        collided do not collide again. Inside an outer transaction the error is
+        raised as is, only the outermost transaction can be run again.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as exc:
+                if (
+                    attempt >= settings.SQLITE_WRITE_RETRIES
+                    or connection.in_atomic_block
+                    or not is_locked(exc)
+                ):
+                    raise
+            if metrics.enabled():
+                metrics.registry.increment(metrics.SQLITE_WRITE_RETRIES, func.__name__)
+            time.sleep(random.uniform(0, settings.SQLITE_RETRY_BACKOFF * 2**attempt))
+            attempt += 1
+
+    return wrapper
@@ -1,16 +1,26 @@
 from django.urls import path, include
 from rest_framework import routers
 
-from core.views import QuotesViewSet, UserViewSet, CheckOutViewSet
+from core.views import (
+    QuotesViewSet,
+    UserViewSet,
+    CheckOutViewSet,
+    ExportViewSet,
+    async_checkout,
+    async_quotes,
+)
 
 router = routers.DefaultRouter()
 
 router.register(r"quotes", QuotesViewSet, basename="quotes")
 router.register(r"checkout", CheckOutViewSet, basename="checkout")
 router.register(r"users", UserViewSet, basename="users")
+router.register(r"export", ExportViewSet, basename="export")
 
 
 app_name = "core"
 urlpatterns = [
     path("", include(router.urls)),
+    path("async/quotes/", async_quotes, name="async-quotes"),
+    path("async/checkout/", async_checkout, name="async-checkout"),
 ]
@@ -1,23 +1,103 @@
-import json
-import pgeocode
+from typing import TYPE_CHECKING
+
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
+from core import metrics
 from core.constants import states
+from core.zip_index import ZIP_CODE_LENGTH, get_zip_index
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Per row error codes of the bulk validators
+VALID = 0
+MALFORMED_ZIP_CODE = 1
+UNKNOWN_ZIP_CODE = 2
+UNKNOWN_STATE = 3
+# Set by ``parse_addresses`` for the addresses that could not be tagged
+UNPARSEABLE_ADDRESS = 4
+
+ADDRESS_ERROR_MESSAGES = {
+    UNPARSEABLE_ADDRESS: _("Not a valid US address."),
+    MALFORMED_ZIP_CODE: _("Not a valid zip code."),
+    UNKNOWN_ZIP_CODE: _("Unknown zip code."),
+    UNKNOWN_STATE: _("Unknown state."),
+}
+
 
+def address_error_messages(codes) -> list[str]:
+    """
+    Description:
+        Messages of the per row error ``codes`` of an address, for the ``address``
+        entry of its errors.
+    """
+    return [str(ADDRESS_ERROR_MESSAGES[code]) for code in codes]
 
+
+@metrics.timed("zip_code_validator")
 def zip_code_validator(zip_code: str) -> None:
-    country: str = "us"
-    nomi = pgeocode.Nominatim(country)
-    if json.loads(nomi.query_postal_code(zip_code).to_json())["country_code"] is None:
+    if zip_code not in get_zip_index():
         raise ValidationError(
-            _("%(value) is not valid zip code"),
+            _("%(value)s is not valid zip code"),
             params={"value": zip_code},
         )
 
 
+@metrics.timed("state_validator")
 def state_validator(state_name: str) -> None:
-    if state_name not in [st_name for st_name in states]:
+    if state_name not in states:
         raise ValidationError(
-            _("%(value) is not valid state name"),
+            _("%(value)s is not valid state name"),
             params={"value": state_name},
         )
+
+
+def validate_zip_codes(zip_codes) -> "tuple[np.ndarray, np.ndarray]":
+    """
+    Description:
+        Bulk version of ``zip_code_validator`` for a whole column of zip codes.
+
+    Returns:
+        tuple: boolean mask of the valid rows and the per row error codes
+        (``VALID``, ``MALFORMED_ZIP_CODE`` or ``UNKNOWN_ZIP_CODE``).
+    """
+    import numpy as np
+
+    values = np.asarray(zip_codes, dtype=str).reshape(-1)
+    well_formed = np.char.str_len(values) == ZIP_CODE_LENGTH
+
+    # Code points of the first 5 characters, one row per zip code
+    code_points = (
+        values.astype(f"U{ZIP_CODE_LENGTH}")
+        .view(np.uint32)
+        .reshape(-1, ZIP_CODE_LENGTH)
+        .astype(np.int64)
+    )
+    digits = code_points - ord("0")
+    well_formed &= ((digits >= 0) & (digits <= 9)).all(axis=1)
+
+    digit_weights = 10 ** np.arange(ZIP_CODE_LENGTH - 1, -1, -1)
+    slots = np.where(well_formed, digits @ digit_weights, 0)
+    known = well_formed & (get_zip_index().records()["state_code"][slots] != b"")
+
+    errors = np.full(values.shape, VALID, dtype=np.int8)
+    errors[~known] = UNKNOWN_ZIP_CODE
+    errors[~well_formed] = MALFORMED_ZIP_CODE
+    return known, errors
+
+
+def validate_states(state_names) -> "tuple[np.ndarray, np.ndarray]":
+    """
+    Description:
+        Bulk version of ``state_validator`` for a whole column of state codes.
+
+    Returns:
+        tuple: boolean mask of the valid rows and the per row error codes
+        (``VALID`` or ``UNKNOWN_STATE``).
+    """
+    import numpy as np
+
+    values = np.asarray(state_names, dtype=str).reshape(-1)
+    valid = np.isin(values, sorted(states))
+    errors = np.where(valid, VALID, UNKNOWN_STATE).astype(np.int8)
+    return valid, errors
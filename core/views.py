@@ -1,20 +1,50 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseNotAllowed,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from rest_framework import serializers, status
-from rest_framework.authtoken.models import Token
+from rest_framework.decorators import action
+from rest_framework.exceptions import AuthenticationFailed, NotFound, ValidationError
 from rest_framework.mixins import CreateModelMixin
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.response import Response
 from rest_framework.viewsets import ViewSet, GenericViewSet
 from django.contrib.auth import get_user_model
+from core import metrics, warmup
+from core.authentication import CachedTokenAuthentication
 from core.models import Quote, Policy
-from core.services.policies.services import checkout
-from core.services.quotes.services import create_quote
+from core.queries import query_budget
+from core.services.exports.services import EXPORT_FORMATS, export
+from core.services.policies.services import acheckout, checkout
+from core.services.quotes.write_behind import QuoteNotWritten
+from core.services.quotes.services import (
+    acreate_quote,
+    create_quote,
+    create_quotes,
+    get_cached_quote,
+    get_quote,
+)
+from core.validators import address_error_messages
 
 User = get_user_model()
 
+# Checkout of a quote the write-behind queue has not written yet, the 503 is not
+# stored under an idempotency key so the retry is checked out for real
+QUOTE_NOT_WRITTEN = "The quote is not saved yet, retry shortly."
+QUOTE_NOT_WRITTEN_RETRY_AFTER = "1"
+
 
 class QuotesViewSet(ViewSet, CreateModelMixin):
     queryset = Quote.objects.none()
     permission_classes = [IsAuthenticated]
+    lookup_field = "quote_number"
 
     class InputModelSerializer(serializers.ModelSerializer):
         had_previously_cancel_volcano_policy = serializers.BooleanField(default=False)
@@ -34,6 +64,7 @@ class QuotesViewSet(ViewSet, CreateModelMixin):
                 "policy_holder",
             )
 
+    @query_budget(10)
     def create(self, request, *args, **kwargs):
         serializer = self.InputModelSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -45,6 +76,8 @@ class QuotesViewSet(ViewSet, CreateModelMixin):
             new_property=serializer.data["new_property"],
             address=serializer.data["address"],
         )
+        if quote is None:
+            raise ValidationError({"address": ["Not a valid US address."]})
         headers = self.get_success_headers(serializer.data)
 
         return Response(
@@ -53,6 +86,64 @@ class QuotesViewSet(ViewSet, CreateModelMixin):
             headers=headers,
         )
 
+    @query_budget(2)
+    def retrieve(self, request, quote_number=None, *args, **kwargs):
+        """
+        Quote details with a strong ETag. A matching ``If-None-Match`` is answered
+        with a 304 straight from the cache.
+        """
+        if_none_match = request.headers.get("If-None-Match")
+        cached = get_cached_quote(quote_number) if if_none_match else None
+        if cached is None:
+            cached = get_quote(quote_number)
+            if cached is None:
+                raise NotFound()
+
+        etag, payload = cached
+        if if_none_match and etag in (tag.strip() for tag in if_none_match.split(",")):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        return Response(payload, headers={"ETag": etag})
+
+    @query_budget(12)
+    @action(detail=False, methods=["post"])
+    def batch(self, request, *args, **kwargs):
+        """
+        Price a list of quotes in one pass. Each item of the response holds either
+        the ``quote_number`` or the ``errors`` of the matching input.
+        """
+        if not isinstance(request.data, list):
+            raise ValidationError({"non_field_errors": ["Expected a list of quotes."]})
+        if len(request.data) > settings.QUOTE_BATCH_MAX_SIZE:
+            raise ValidationError(
+                {
+                    "non_field_errors": [
+                        f"A batch holds at most {settings.QUOTE_BATCH_MAX_SIZE} quotes."
+                    ]
+                }
+            )
+
+        results = [{} for _ in request.data]
+        valid_items = []
+        for result, item in zip(results, request.data):
+            serializer = self.InputModelSerializer(data=item)
+            if serializer.is_valid():
+                valid_items.append((result, serializer.data))
+            else:
+                result["errors"] = serializer.errors
+
+        quotes, errors = create_quotes([data for _, data in valid_items])
+        for (result, _), quote, codes in zip(valid_items, quotes, errors):
+            if quote is None:
+                result["errors"] = {"address": address_error_messages(codes)}
+            else:
+                result["quote_number"] = quote.quote_number
+
+        failed = any("errors" in result for result in results)
+        return Response(
+            results,
+            status=status.HTTP_207_MULTI_STATUS if failed else status.HTTP_201_CREATED,
+        )
+
 
 class CheckOutViewSet(ViewSet, CreateModelMixin):
     queryset = Policy.objects.none()
@@ -65,16 +156,56 @@ class CheckOutViewSet(ViewSet, CreateModelMixin):
             model = Quote
             fields = ("quote_number",)
 
+    @query_budget(6)
     def create(self, request, *args, **kwargs):
         serializer = self.InputModelSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        checkout(quote_number=serializer.data["quote_number"])
+        try:
+            checkout(quote_number=serializer.data["quote_number"])
+        except Quote.DoesNotExist:
+            raise NotFound()
+        except QuoteNotWritten:
+            return Response(
+                {"detail": QUOTE_NOT_WRITTEN},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": QUOTE_NOT_WRITTEN_RETRY_AFTER},
+            )
         headers = self.get_success_headers(serializer.data)
         return Response(
             serializer.data, status=status.HTTP_201_CREATED, headers=headers
         )
 
 
+class ExportViewSet(ViewSet):
+    """
+    Full extracts of the quotes and policies for downstream jobs, streamed as CSV
+    (``?output=csv``, the default) or NDJSON (``?output=ndjson``).
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def stream(self, request, name):
+        export_format = request.query_params.get("output", "csv")
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError(
+                {"output": [f"Use one of {', '.join(EXPORT_FORMATS)}."]}
+            )
+        response = StreamingHttpResponse(
+            export(name, export_format), content_type=EXPORT_FORMATS[export_format]
+        )
+        extension = "csv" if export_format == "csv" else "ndjson"
+        response["Content-Disposition"] = f'attachment; filename="{name}.{extension}"'
+        return response
+
+    @action(detail=False, methods=["get"])
+    def quotes(self, request, *args, **kwargs):
+        return self.stream(request, "quotes")
+
+    @action(detail=False, methods=["get"])
+    def policies(self, request, *args, **kwargs):
+        return self.stream(request, "policies")
+
+
 class UserViewSet(CreateModelMixin, GenericViewSet):
     queryset = User.objects.none()
     permission_classes = [AllowAny]
@@ -83,20 +214,130 @@ class UserViewSet(CreateModelMixin, GenericViewSet):
         class Meta:
             model = User
             fields = ["username", "email", "password"]
-    
+
+    @query_budget(3)
     def create(self, request, *args, **kwargs):
         serializer = self.UserSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        user = serializer.save()
         headers = self.get_success_headers(serializer.data)
-        User = get_user_model()
-        user = User.objects.get(**serializer.data)
-        
-        obj, _ = Token.objects.get_or_create(user=user)
-        
+
+        # The post_save signal created the token and cached it on the user
         return Response(
-            {
-                "token": obj.key
-            },
-            status=status.HTTP_201_CREATED, headers=headers
-        )
\ No newline at end of file
+            {"token": user.auth_token.key},
+            status=status.HTTP_201_CREATED,
+            headers=headers,
+        )
+
+
+async def _async_input(
+    request, serializer_class
+) -> tuple[dict | None, JsonResponse | None]:
+    """
+    Authenticate the token of an async API request and validate its JSON body.
+
+    Returns:
+        tuple: the validated data, or the error response to send back.
+    """
+    if request.method != "POST":
+        return None, HttpResponseNotAllowed(["POST"])
+
+    try:
+        credentials = await sync_to_async(CachedTokenAuthentication().authenticate)(
+            request
+        )
+    except AuthenticationFailed as ex:
+        return None, JsonResponse({"detail": ex.detail}, status=ex.status_code)
+    if credentials is None:
+        return None, JsonResponse(
+            {"detail": "Authentication credentials were not provided."},
+            status=status.HTTP_401_UNAUTHORIZED,
+        )
+
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return None, JsonResponse(
+            {"detail": "JSON parse error."}, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    serializer = serializer_class(data=data)
+    if not serializer.is_valid():
+        return None, JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    return serializer.data, None
+
+
+async def async_quotes(request):
+    """
+    Async version of ``QuotesViewSet.create`` for the ASGI application.
+    """
+    data, error = await _async_input(request, QuotesViewSet.InputModelSerializer)
+    if error is not None:
+        return error
+
+    quote = await acreate_quote(
+        had_previously_cancel_volcano_policy=data[
+            "had_previously_cancel_volcano_policy"
+        ],
+        never_cancel_volcano_policy=data["never_cancel_volcano_policy"],
+        new_property=data["new_property"],
+        address=data["address"],
+    )
+    if quote is None:
+        return JsonResponse(
+            {"address": ["Not a valid US address."]}, status=status.HTTP_400_BAD_REQUEST
+        )
+    return JsonResponse(
+        {"quote_number": quote.quote_number}, status=status.HTTP_201_CREATED
+    )
+
+
+async def async_checkout(request):
+    """
+    Async version of ``CheckOutViewSet.create`` for the ASGI application.
+    """
+    data, error = await _async_input(request, CheckOutViewSet.InputModelSerializer)
+    if error is not None:
+        return error
+
+    try:
+        await acheckout(quote_number=data["quote_number"])
+    except Quote.DoesNotExist:
+        return JsonResponse({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+    except QuoteNotWritten:
+        response = JsonResponse(
+            {"detail": QUOTE_NOT_WRITTEN}, status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+        response["Retry-After"] = QUOTE_NOT_WRITTEN_RETRY_AFTER
+        return response
+    return JsonResponse(data, status=status.HTTP_201_CREATED)
+
+
+def metrics_view(request):
+    """
+    Stage timings of every worker in the Prometheus text format, 404 unless
+    ``settings.METRICS_ENABLED``.
+    """
+    if not metrics.enabled():
+        raise Http404
+    return HttpResponse(
+        metrics.render(metrics.collect()), content_type=metrics.CONTENT_TYPE
+    )
+
+
+def readiness_view(request):
+    """
+    Readiness probe, 503 until ``core.warmup.warm_up`` has finished in this
+    process so no request pays for loading the address model or zip index.
+    """
+    if not warmup.is_ready():
+        return JsonResponse(
+            {"status": "warming up"}, status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+    return JsonResponse({"status": "ready", "warmup": warmup.timings()})
+
+
+# Token authentication only, like the DRF views there is no CSRF check. Set
+# directly since csrf_exempt() would wrap the coroutines in a sync function.
+async_quotes.csrf_exempt = True
+async_checkout.csrf_exempt = True
@@ -0,0 +1,91 @@
+"""
+Load everything the first requests of a process would otherwise pay for: the
+URL configuration and views, the usaddress CRF model, the zip index with numpy
+and the rating table. ``manage.py serve`` runs it in the master before forking
+its workers, so they share those pages copy-on-write. ``/ready`` answers 503
+until it has finished in the process serving it.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_ready = threading.Event()
+_started = threading.Lock()
+_timings: dict[str, float] = {}
+
+
+def _urls() -> None:
+    from django.urls import reverse
+
+    reverse("core:quotes-list")
+
+
+def _usaddress() -> None:
+    from core.services.quotes.parsing import WARMUP_ADDRESS, tag_address
+
+    tag_address(WARMUP_ADDRESS)
+
+
+def _zip_index() -> None:
+    from core.validators import validate_states, validate_zip_codes
+    from core.zip_index import get_zip_index
+
+    get_zip_index()
+    validate_zip_codes(["20500"])
+    validate_states(["DC"])
+
+
+def _rating_table() -> None:
+    from core.services.quotes.services import (
+        monthly_base_volcano_policy_price,
+        rating_table,
+        term,
+    )
+
+    rating_table(monthly_base_volcano_policy_price, term)
+
+
+STEPS = (
+    ("urls", _urls),
+    ("usaddress", _usaddress),
+    ("zip_index", _zip_index),
+    ("rating_table", _rating_table),
+)
+
+
+def warm_up() -> dict[str, float]:
+    """
+    Description:
+        Run every warmup step and mark the process ready. Returns the seconds
+        each step took.
+    """
+    for name, step in STEPS:
+        start = time.perf_counter()
+        step()
+        _timings[name] = time.perf_counter() - start
+    _ready.set()
+    logger.info(
+        "Warmed up in %.2fs (%s)",
+        sum(_timings.values()),
+        ", ".join(f"{name} {seconds:.2f}s" for name, seconds in _timings.items()),
+    )
+    return dict(_timings)
+
+
+def warm_up_in_background() -> None:
+    """
+    Description:
+        Start ``warm_up`` on a daemon thread, once per process.
+    """
+    if _started.acquire(blocking=False):
+        threading.Thread(target=warm_up, name="warmup", daemon=True).start()
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+def timings() -> dict[str, float]:
+    return dict(_timings)
@@ -0,0 +1,221 @@
+import csv
+import functools
+import logging
+import math
+import mmap
+import os
+import struct
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+ZIP_CODE_LENGTH = 5
+ZIP_CODE_SLOTS = 10**ZIP_CODE_LENGTH
+
+# File layout: a fixed header followed by one fixed width record per possible
+# 5 digit zip code (00000-99999), so the record offset is the zip code itself.
+MAGIC = b"VQZIPIDX"
+HEADER = struct.Struct("<8sII")
+RECORD = struct.Struct("<2sff")
+EMPTY_STATE = b"\x00\x00"
+
+# Column positions of the GeoNames postal code dump
+GEONAMES_POSTAL_CODE = 1
+GEONAMES_STATE_CODE = 4
+GEONAMES_LATITUDE = 9
+GEONAMES_LONGITUDE = 10
+
+
+class ZipRecord(NamedTuple):
+    state_code: str
+    latitude: float
+    longitude: float
+
+
+def read_pgeocode(country: str = "us") -> dict[str, ZipRecord]:
+    """
+    Description:
+        Postal codes of ``country`` from pgeocode, downloading the data on first use.
+    """
+    import pgeocode
+
+    data = pgeocode.Nominatim(country)._data_frame
+    return {
+        postal_code: ZipRecord(state_code, latitude, longitude)
+        for postal_code, state_code, latitude, longitude in zip(
+            data["postal_code"],
+            data["state_code"],
+            data["latitude"],
+            data["longitude"],
+        )
+        if isinstance(postal_code, str) and isinstance(state_code, str)
+    }
+
+
+def read_geonames(path: str | os.PathLike) -> dict[str, ZipRecord]:
+    """
+    Description:
+        Postal codes of a GeoNames dump (tab separated, no header), the file
+        pgeocode downloads, so the index can be built on an offline node.
+    """
+    records = {}
+    with open(path, newline="", encoding="utf-8") as fh:
+        for row in csv.reader(fh, delimiter="\t"):
+            postal_code, state_code = (
+                row[GEONAMES_POSTAL_CODE],
+                row[GEONAMES_STATE_CODE],
+            )
+            if not state_code or postal_code in records:
+                continue
+            records[postal_code] = ZipRecord(
+                state_code,
+                float(row[GEONAMES_LATITUDE] or "nan"),
+                float(row[GEONAMES_LONGITUDE] or "nan"),
+            )
+    return records
+
+
+def zip_code_slot(zip_code: str) -> int | None:
+    """
+    Description:
+        Map a 5 digit US zip code to its slot in the index, ``None`` when the
+        value can not be a zip code at all.
+    """
+    if (
+        not isinstance(zip_code, str)
+        or len(zip_code) != ZIP_CODE_LENGTH
+        or not zip_code.isdigit()
+        or not zip_code.isascii()
+    ):
+        return None
+    return int(zip_code)
+
+
+class ZipIndex:
+    """
+    Description:
+        Direct addressed table of every US zip code (state code, latitude and
+        longitude). Empty slots are unknown zip codes, so a lookup is a slice of
+        the buffer instead of a pandas query. The buffer is either built in memory
+        or an ``mmap`` of the file written by ``manage.py build_zip_index``, in
+        which case every worker shares the same page cache copy.
+    """
+
+    def __init__(self, buffer: bytes | mmap.mmap) -> None:
+        magic, slots, record_size = HEADER.unpack_from(buffer, 0)
+        if (
+            magic != MAGIC
+            or slots != ZIP_CODE_SLOTS
+            or record_size != RECORD.size
+            or len(buffer) != HEADER.size + slots * record_size
+        ):
+            raise ValueError("Zip index buffer has an unexpected layout")
+        self._buffer = buffer
+
+    @staticmethod
+    def pack(records: dict[str, ZipRecord]) -> bytes:
+        buffer = bytearray(HEADER.size + ZIP_CODE_SLOTS * RECORD.size)
+        HEADER.pack_into(buffer, 0, MAGIC, ZIP_CODE_SLOTS, RECORD.size)
+        for zip_code, record in records.items():
+            slot = zip_code_slot(zip_code)
+            if slot is None or not record.state_code:
+                continue
+            RECORD.pack_into(
+                buffer,
+                HEADER.size + slot * RECORD.size,
+                record.state_code.encode("ascii")[:2],
+                record.latitude,
+                record.longitude,
+            )
+        return bytes(buffer)
+
+    @classmethod
+    def from_records(cls, records: dict[str, ZipRecord]) -> "ZipIndex":
+        return cls(cls.pack(records))
+
+    @classmethod
+    def from_mapping(cls, zip_codes: dict[str, str]) -> "ZipIndex":
+        return cls.from_records(
+            {
+                zip_code: ZipRecord(state_code, math.nan, math.nan)
+                for zip_code, state_code in zip_codes.items()
+            }
+        )
+
+    @classmethod
+    def from_pgeocode(cls, country: str = "us") -> "ZipIndex":
+        return cls.from_records(read_pgeocode(country))
+
+    @classmethod
+    def from_file(cls, path: str | os.PathLike) -> "ZipIndex":
+        with open(path, "rb") as fh:
+            return cls(mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def records(self):
+        """
+        Description:
+            Zero copy numpy view of every record, indexed by zip code slot.
+        """
+        import numpy as np
+
+        return np.frombuffer(
+            self._buffer,
+            dtype=np.dtype(
+                [("state_code", "S2"), ("latitude", "<f4"), ("longitude", "<f4")]
+            ),
+            count=ZIP_CODE_SLOTS,
+            offset=HEADER.size,
+        )
+
+    def lookup(self, zip_code: str) -> ZipRecord | None:
+        slot = zip_code_slot(zip_code)
+        if slot is None:
+            return None
+        state_code, latitude, longitude = RECORD.unpack_from(
+            self._buffer, HEADER.size + slot * RECORD.size
+        )
+        if state_code == EMPTY_STATE:
+            return None
+        return ZipRecord(
+            state_code.rstrip(b"\x00").decode("ascii"), latitude, longitude
+        )
+
+    def __contains__(self, zip_code: str) -> bool:
+        slot = zip_code_slot(zip_code)
+        if slot is None:
+            return False
+        offset = HEADER.size + slot * RECORD.size
+        return self._buffer[offset : offset + 2] != EMPTY_STATE
+
+    def state_for(self, zip_code: str) -> str | None:
+        record = self.lookup(zip_code)
+        return record.state_code if record else None
+
+
+@functools.lru_cache(maxsize=None)
+def get_zip_index() -> ZipIndex:
+    """
+    Description:
+        Zip index shared by every caller in the process, loaded on first use.
+        Reads the prebuilt ``settings.ZIP_INDEX_PATH`` file when it exists and
+        only falls back to downloading the pgeocode data otherwise.
+    """
+    path = settings.ZIP_INDEX_PATH
+    if os.path.exists(path):
+        return ZipIndex.from_file(path)
+    logger.warning(
+        "Zip index %s not found, loading pgeocode data. "
+        "Run `manage.py build_zip_index` to build it.",
+        path,
+    )
+    return ZipIndex.from_pgeocode()
+
+
+@receiver(setting_changed)
+def reset_zip_index(setting, **kwargs):
+    if setting == "ZIP_INDEX_PATH":
+        get_zip_index.cache_clear()
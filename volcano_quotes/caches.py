@@ -0,0 +1,60 @@
+"""
+``CACHES`` entry built from a ``CACHE_URL``, so the environment picks the
+backend:
+
+    locmem://                     memory of each process, the default
+    redis://host:6379/0           shared by every process using the server
+    file:///absolute/directory    shared by the processes of one host
+
+The quote payloads served by GET /api/quotes/{quote_number}/, the responses
+stored for idempotency keys and the markers of the keys in flight live in this
+cache. With several ``manage.py serve`` workers use a shared backend, otherwise
+each worker only sees and invalidates its own entries. Use Redis rather than the
+file cache: its ``add`` is a check then a write, not atomic, so two workers can
+both take the in-flight marker of an idempotency key and run the request twice.
+"""
+from urllib.parse import unquote, urlsplit
+
+from django.core.exceptions import ImproperlyConfigured
+
+BACKENDS = {
+    "locmem": "django.core.cache.backends.locmem.LocMemCache",
+    "redis": "django.core.cache.backends.redis.RedisCache",
+    "rediss": "django.core.cache.backends.redis.RedisCache",
+    "file": "django.core.cache.backends.filebased.FileBasedCache",
+}
+
+
+def cache_from_url(url: str, max_entries: int | None = None) -> dict:
+    """
+    Description:
+        ``CACHES`` entry for ``url``. The locmem and file caches cull entries
+        past ``max_entries``, Redis evicts by its own ``maxmemory`` policy.
+    """
+    parts = urlsplit(url)
+    backend = BACKENDS.get(parts.scheme)
+    if backend is None:
+        raise ImproperlyConfigured(
+            f"Unsupported CACHE_URL scheme {parts.scheme!r}, "
+            f"use one of {', '.join(BACKENDS)}"
+        )
+
+    if parts.scheme in ("redis", "rediss"):
+        return {"BACKEND": backend, "LOCATION": url}
+
+    cache = {
+        "BACKEND": backend,
+        "LOCATION": parts.netloc if parts.scheme == "locmem" else unquote(parts.path),
+    }
+    if max_entries:
+        cache["OPTIONS"] = {"MAX_ENTRIES": max_entries}
+    return cache
+
+
+def is_shared(cache: dict) -> bool:
+    return cache["BACKEND"] != BACKENDS["locmem"]
+
+
+def has_atomic_add(cache: dict) -> bool:
+    # Atomic between every process sharing the cache, not only between threads
+    return cache["BACKEND"] not in (BACKENDS["locmem"], BACKENDS["file"])
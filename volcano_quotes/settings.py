@@ -13,6 +13,9 @@ https://docs.djangoproject.com/en/4.0/ref/settings/
 import os
 from pathlib import Path
 
+from volcano_quotes.caches import cache_from_url
+from volcano_quotes.database import database_from_url
+
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -49,11 +52,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "core.middleware.MetricsMiddleware",
+    "core.middleware.QueryBudgetMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "core.middleware.IdempotencyKeyMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -88,20 +94,178 @@ REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
         "rest_framework.authentication.BasicAuthentication",
         "rest_framework.authentication.SessionAuthentication",
-        "rest_framework.authentication.TokenAuthentication",
+        "core.authentication.CachedTokenAuthentication",
     ],
 }
 
+# In-process cache of authenticated tokens, see core.authentication. A deleted
+# token, or a user saved with a new password, is_active, is_staff or
+# is_superuser, is revoked at once on every worker sharing CACHE_URL; with the
+# per process locmem:// cache the other workers keep accepting it for up to
+# TOKEN_CACHE_TTL seconds
+
+TOKEN_CACHE_MAX_SIZE = int(os.getenv("TOKEN_CACHE_MAX_SIZE", "10000"))
+
+TOKEN_CACHE_TTL = int(os.getenv("TOKEN_CACHE_TTL", "300"))
+
+# Responses replayed for retried POSTs carrying an Idempotency-Key header, kept
+# in the default cache, see core.middleware. A request holds its key for at most
+# IDEMPOTENCY_LOCK_TIMEOUT seconds, in case its worker dies before releasing it.
+
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", "86400"))
+
+IDEMPOTENCY_WAIT_TIMEOUT = int(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", "30"))
+
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT", "60"))
+
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
+# DATABASE_URL picks the backend, e.g. postgres://volcano:secret@db:5432/volcano,
+# see volcano_quotes.database. SQLite serializes every write, use PostgreSQL
+# with more than one worker. Connections stay open DATABASE_CONN_MAX_AGE seconds.
+
+DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{BASE_DIR / 'db.sqlite3'}")
+
+DATABASE_CONN_MAX_AGE = int(os.getenv("DATABASE_CONN_MAX_AGE", "60"))
+
+# Set when DATABASE_URL points to PgBouncer in transaction pooling mode
+DATABASE_PGBOUNCER = os.getenv("DATABASE_PGBOUNCER", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
 
 DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    }
+    "default": database_from_url(
+        DATABASE_URL, conn_max_age=DATABASE_CONN_MAX_AGE, pgbouncer=DATABASE_PGBOUNCER
+    )
 }
 
+# Cache
+# https://docs.djangoproject.com/en/4.0/ref/settings/#caches
+# CACHE_URL picks the backend, e.g. redis://redis:6379/0, see volcano_quotes.caches.
+# The default keeps entries in the memory of each process, use a shared backend
+# with more than one worker.
+
+CACHE_URL = os.getenv("CACHE_URL", "locmem://")
+
+# Entries of the locmem and file caches before they are culled
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+
+CACHES = {"default": cache_from_url(CACHE_URL, max_entries=CACHE_MAX_ENTRIES)}
+
+# Opt-in SQLite tuning for concurrent writers (WAL journal, synchronous=NORMAL,
+# memory mapped reads, larger page cache), see core.sqlite. Write transactions
+# SQLite reports locked are retried with exponential backoff in any mode.
+
+SQLITE_CONCURRENCY_MODE = os.getenv("SQLITE_CONCURRENCY_MODE", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+# Milliseconds a connection waits for the write lock
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))
+
+# Bytes of the database file memory mapped by each connection
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+# KiB of page cache per connection
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", str(64 * 1024)))
+
+SQLITE_WRITE_RETRIES = int(os.getenv("SQLITE_WRITE_RETRIES", "8"))
+
+# Seconds, the upper bound of the first retry's random wait, doubled on every retry
+SQLITE_RETRY_BACKOFF = float(os.getenv("SQLITE_RETRY_BACKOFF", "0.01"))
+
+# Prebuilt US zip code dataset, see `manage.py build_zip_index`
+
+ZIP_INDEX_PATH = os.getenv(
+    "ZIP_INDEX_PATH", str(BASE_DIR / "data" / "us_zip_index.bin")
+)
+
+# In-process cache of parsed addresses, see core.services.quotes.services.parse_address
+
+ADDRESS_CACHE_MAX_SIZE = int(os.getenv("ADDRESS_CACHE_MAX_SIZE", "10000"))
+
+ADDRESS_CACHE_TTL = int(os.getenv("ADDRESS_CACHE_TTL", "3600"))
+# Threads tagging addresses for the async quote endpoint
+
+ADDRESS_PARSER_THREADS = int(os.getenv("ADDRESS_PARSER_THREADS", "4"))
+
+# Seconds a quote stays in the read through cache of GET /api/quotes/{quote_number}/
+
+QUOTE_CACHE_TIMEOUT = int(os.getenv("QUOTE_CACHE_TIMEOUT", "300"))
+
+# Quote numbers each process reserves at once, see core.services.quotes.numbers
+
+QUOTE_NUMBER_BLOCK_SIZE = int(os.getenv("QUOTE_NUMBER_BLOCK_SIZE", "1000"))
+
+
+# Return new quotes before they are written, see core.services.quotes.write_behind.
+# Quotes are inserted in batches of up to QUOTE_WRITE_BEHIND_BATCH_SIZE collected
+# for at most QUOTE_WRITE_BEHIND_FLUSH_INTERVAL seconds. Once
+# QUOTE_WRITE_BEHIND_QUEUE_SIZE quotes are queued, a request waits up to
+# QUOTE_WRITE_BEHIND_PUT_TIMEOUT seconds for room before writing its quote itself.
+
+QUOTE_WRITE_BEHIND = os.getenv("QUOTE_WRITE_BEHIND", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+QUOTE_WRITE_BEHIND_BATCH_SIZE = int(os.getenv("QUOTE_WRITE_BEHIND_BATCH_SIZE", "500"))
+
+QUOTE_WRITE_BEHIND_FLUSH_INTERVAL = float(
+    os.getenv("QUOTE_WRITE_BEHIND_FLUSH_INTERVAL", "0.05")
+)
+
+QUOTE_WRITE_BEHIND_QUEUE_SIZE = int(os.getenv("QUOTE_WRITE_BEHIND_QUEUE_SIZE", "10000"))
+
+QUOTE_WRITE_BEHIND_PUT_TIMEOUT = float(os.getenv("QUOTE_WRITE_BEHIND_PUT_TIMEOUT", "1"))
+
+# Seconds a queued quote stays published to the other workers, an upper bound on
+# how long a quote lost with its process is served
+
+QUOTE_WRITE_BEHIND_PENDING_TIMEOUT = int(
+    os.getenv("QUOTE_WRITE_BEHIND_PENDING_TIMEOUT", "60")
+)
+
+# Seconds the queued quotes get to be written when the process stops
+
+QUOTE_WRITE_BEHIND_SHUTDOWN_TIMEOUT = int(
+    os.getenv("QUOTE_WRITE_BEHIND_SHUTDOWN_TIMEOUT", "30")
+)
+
+# Largest number of quotes accepted by POST /api/quotes/batch/
+
+QUOTE_BATCH_MAX_SIZE = int(os.getenv("QUOTE_BATCH_MAX_SIZE", "500"))
+
+# Stage timings served at /metrics, see core.metrics. With several worker
+# processes set METRICS_DIR to a directory they share to aggregate them.
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() in ("1", "true", "yes")
+
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+
+METRICS_FLUSH_INTERVAL = int(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+
+# Per request query counts and N+1 warnings, see core.middleware.QueryBudgetMiddleware
+
+QUERY_BUDGET_ENABLED = os.getenv(
+    "QUERY_BUDGET_ENABLED", "true" if DEBUG else "false"
+).lower() in ("1", "true", "yes")
+
+# Worker processes of `manage.py serve`, the requests each one serves at once
+# (and database connections it keeps open), and the seconds they get to finish
+# the requests in flight when it stops
+
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", str(os.cpu_count() or 1)))
+
+SERVE_THREADS = int(os.getenv("SERVE_THREADS", "8"))
+
+SERVE_GRACEFUL_TIMEOUT = int(os.getenv("SERVE_GRACEFUL_TIMEOUT", "30"))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
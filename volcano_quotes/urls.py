@@ -13,46 +13,64 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import functools
+
 from django.contrib import admin
 from django.urls import path, include, re_path
 from django.conf import settings as api_settings
 from django.conf.urls.static import static
 from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-
-
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Volcano Insurance API",
-        default_version="v1",
-        description="Simple API to quote Volcano Insurance",
-        terms_of_service="https://www.google.com/policies/terms/",
-        contact=openapi.Contact(email="acabrea@sureapp.com"),
-        license=openapi.License(name="BSD License"),
-    ),
-    public=True,
-    permission_classes=[permissions.AllowAny],
-)
+from core.views import metrics_view, readiness_view
+
+
+@functools.lru_cache(maxsize=None)
+def schema_view(renderer: str):
+    # drf_yasg and its spec validator take longer to import than the whole API,
+    # so they are only loaded when the documentation is first requested
+    from drf_yasg import openapi
+    from drf_yasg.views import get_schema_view
+
+    view = get_schema_view(
+        openapi.Info(
+            title="Volcano Insurance API",
+            default_version="v1",
+            description="Simple API to quote Volcano Insurance",
+            terms_of_service="https://www.google.com/policies/terms/",
+            contact=openapi.Contact(email="acabrea@sureapp.com"),
+            license=openapi.License(name="BSD License"),
+        ),
+        public=True,
+        permission_classes=[permissions.AllowAny],
+    )
+    if renderer == "json":
+        return view.without_ui(cache_timeout=0)
+    return view.with_ui(renderer, cache_timeout=0)
+
+
+def lazy_schema_view(renderer: str):
+    def view(request, *args, **kwargs):
+        return schema_view(renderer)(request, *args, **kwargs)
+
+    return view
 
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include("core.urls", namespace="core")),
     path("api-auth/", include("rest_framework.urls")),
+    path("metrics", metrics_view, name="metrics"),
+    path("ready", readiness_view, name="ready"),
     re_path(
         r"^swagger(?P<format>\.json|\.yaml)$",
-        schema_view.without_ui(cache_timeout=0),
+        lazy_schema_view("json"),
         name="schema-json",
     ),
     re_path(
         r"^swagger/$",
-        schema_view.with_ui("swagger", cache_timeout=0),
+        lazy_schema_view("swagger"),
         name="schema-swagger-ui",
     ),
-    re_path(
-        r"^redoc/$", schema_view.with_ui("redoc", cache_timeout=0), name="schema-redoc"
-    ),
+    re_path(r"^redoc/$", lazy_schema_view("redoc"), name="schema-redoc"),
 ]
 
 